@@ -1,5 +1,102 @@
 from django.contrib import admin
-from game.models import Opponent, Player, Round, Question, Option, Answer
+from django.db import DatabaseError, connections
+from django.db.models.query import QuerySet
+from django.utils.html import format_html_join
+
+from game.answers import get_sheet_answers
+from game.replica import replica_reads
+from game.models import (Opponent, Player, Round, Question, Option, Answer, AnswerSheet,
+                         QuestionnaireVersion)
+
+# Tables estimated to hold more rows than this are not counted exactly when
+# listed without filters.
+ESTIMATE_THRESHOLD = 100000
+
+def estimate_rows(model, using):
+    """Return the number of rows in the model's table according to the
+    database's statistics, or None if it keeps none."""
+    connection = connections[using]
+    cursor = connection.cursor()
+    if connection.vendor == 'mysql':
+        cursor.execute('SELECT table_rows FROM information_schema.tables '
+                       'WHERE table_schema = DATABASE() AND table_name = %s',
+                       [model._meta.db_table])
+    elif connection.vendor == 'sqlite':
+        # Only available after ANALYZE.
+        try:
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                           [model._meta.db_table])
+        except DatabaseError:
+            return None
+    else:
+        return None
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return int(str(row[0]).split()[0])
+
+class EstimatedCountQuerySet(QuerySet):
+    """Counts large tables from the database's statistics when unfiltered,
+    instead of with a COUNT(*) that reads the whole table."""
+
+    def count(self):
+        if not self.query.where and not self.query.low_mark and self.query.high_mark is None:
+            estimate = estimate_rows(self.model, self.db)
+            if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+                return estimate
+        return super(EstimatedCountQuerySet, self).count()
+
+class LargeTableAdmin(admin.ModelAdmin):
+    list_select_related = True
+
+    def queryset(self, request):
+        qs = super(LargeTableAdmin, self).queryset(request)
+        return qs._clone(klass=EstimatedCountQuerySet)
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            # Actions write.
+            return super(LargeTableAdmin, self).changelist_view(request, extra_context)
+        with replica_reads():
+            response = super(LargeTableAdmin, self).changelist_view(request, extra_context)
+            # The list is only read when the response is rendered.
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+class PlayerAdmin(LargeTableAdmin):
+    list_display = ('id', 'opponent_kind', 'registration_datetime', 'finished_datetime',
+                    'rounds_played')
+    list_filter = ('opponent_kind',)
+    date_hierarchy = 'registration_datetime'
+
+class RoundAdmin(LargeTableAdmin):
+    list_display = ('id', 'player', 'opponent', 'amount_offered', 'is_intentional',
+                    'accepted', 'time_elapsed', 'datetime')
+    list_filter = ('opponent__kind', 'accepted', 'is_intentional', 'amount_offered')
+    raw_id_fields = ('player', 'opponent')
+    date_hierarchy = 'datetime'
+
+class AnswerAdmin(LargeTableAdmin):
+    list_display = ('id', 'player', 'question', 'option')
+    list_filter = ('question',)
+    raw_id_fields = ('player', 'option')
+
+class AnswerSheetAdmin(LargeTableAdmin):
+    list_display = ('player', 'version', 'answers')
+    list_filter = ('version',)
+    raw_id_fields = ('player',)
+    readonly_fields = ('answer_list',)
+
+    def answer_list(self, sheet):
+        answers = get_sheet_answers([(sheet.player_id, sheet.version_id, sheet.answers)])
+        answers = answers[sheet.player_id]
+        questions = Question.objects.in_bulk(answers.keys())
+        options = Option.objects.in_bulk(answers.values())
+        return format_html_join('', '<p>{0}: {1}</p>',
+                                ((questions[q].text, options[o].text)
+                                 for q, o in sorted(answers.items())))
+    answer_list.short_description = 'Answers'
 
 class OptionInline(admin.StackedInline):
     model = Option
@@ -12,7 +109,9 @@ class QuestionAdmin(admin.ModelAdmin):
     inlines = [OptionInline]
 
 admin.site.register(Opponent)
-admin.site.register(Player)
-admin.site.register(Round)
+admin.site.register(Player, PlayerAdmin)
+admin.site.register(Round, RoundAdmin)
 admin.site.register(Question, QuestionAdmin)
-admin.site.register(Answer)
+admin.site.register(Answer, AnswerAdmin)
+admin.site.register(AnswerSheet, AnswerSheetAdmin)
+admin.site.register(QuestionnaireVersion)
@@ -0,0 +1,51 @@
+"""Balanced assignment of new players to opponent kinds.
+
+Every kind has a KindCounter row holding the number of players assigned to it.
+A new player is assigned to one of the least used kinds, chosen at random, and
+that kind's counter is bumped with a compare-and-swap UPDATE: it only succeeds
+if the counter still holds the value we based our choice on. No locks are
+held, so concurrent registrations never wait on each other, and because
+counters only ever grow, a successful swap can never make the counters differ
+by more than one. Breaking ties at random amounts to block randomization with
+blocks of one player per kind. The only exception is game.reaper, which lowers
+the counters of the kinds whose abandoned players it deletes, so that the next
+registrations make up for them.
+"""
+import logging
+import random
+
+from django.db.models import Count
+
+from game.models import Kind, KindCounter
+
+logger = logging.getLogger(__name__)
+
+# The number of times a compare-and-swap may lose a race before giving up.
+MAX_ATTEMPTS = 100
+
+def get_counters():
+    counters = list(KindCounter.objects.all())
+    if not counters:
+        counters = initialize_counters()
+    return counters
+
+def initialize_counters():
+    """Create the counters of all kinds from the players assigned so far."""
+    for kind in Kind.objects.annotate(num_players=Count('player')):
+        KindCounter.objects.get_or_create(kind=kind,
+            defaults={'num_players': kind.num_players})
+    return list(KindCounter.objects.all())
+
+def allocate_kind():
+    """Return the kind for a new player and count the player towards it."""
+    for attempt in range(MAX_ATTEMPTS):
+        counters = get_counters()
+        min_players = min(c.num_players for c in counters)
+        counter = random.choice([c for c in counters if c.num_players == min_players])
+        updated = KindCounter.objects.filter(kind=counter.kind_id,
+            num_players=counter.num_players).update(num_players=counter.num_players + 1)
+        if updated:
+            return Kind(id=counter.kind_id)
+        logger.debug('Lost the race for kind %s, retrying', counter.kind_id)
+
+    raise RuntimeError('Could not allocate an opponent kind after %d attempts' % MAX_ATTEMPTS)
@@ -0,0 +1,218 @@
+"""The study's core statistics, computed with NumPy.
+
+The rounds and answers are loaded in bulk (from the database or from a columnar
+export, see game.columnar) into flat arrays, and all statistics are computed
+with grouped array operations rather than Python loops:
+
+* acceptance_rates: the acceptance rate per opponent kind, amount offered and
+  intent, with bootstrap confidence intervals;
+* response_times: the distribution of the time taken to accept or reject an
+  offer, per opponent kind, amount offered and intent;
+* questionnaire_scores: per player, the mean (normalized) option chosen for the
+  questions of each answer scale.
+
+NumPy is only needed for the analysis; the game itself does not depend on it.
+"""
+from __future__ import division
+
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from game.answers import finished_answers
+from game.columnar import SCHEMA_FILE
+from game.archive import databases
+from game.export import all_finished_rounds
+from game.models import Kind
+from game.questionnaire import get_questionnaire
+
+# The opponent kinds, in the order of their codes in Rounds.kind.
+KINDS = [k[0] for k in Kind.IDS]
+
+# The rounds to analyse, as parallel arrays. kind holds indices into KINDS.
+Rounds = namedtuple('Rounds', ['player', 'kind', 'amount_offered',
+                               'is_intentional', 'accepted', 'time_elapsed'])
+
+# The answers to analyse: answers[i, j] is the index of the option that player
+# players[i] chose for question questions[j], or -1 if there's no answer.
+Answers = namedtuple('Answers', ['players', 'questions', 'answers'])
+
+def encode_kinds(kinds):
+    """Return the indices into KINDS of the given kind ids."""
+    codes = np.full(256, -1, dtype=np.int8)
+    for i, k in enumerate(KINDS):
+        codes[ord(k)] = i
+    return codes[np.asarray(kinds, dtype='S1').view(np.uint8)]
+
+def load_rounds(rounds=None):
+    """Load the given rounds (a queryset or a list of them; by default all
+    finished ones, archived or live) with one query per database."""
+    if rounds is None:
+        rounds = all_finished_rounds()
+    rows = []
+    for queryset in rounds if isinstance(rounds, list) else [rounds]:
+        rows.extend(queryset.order_by('id').values_list(
+            'player', 'player__opponent_kind', 'amount_offered', 'is_intentional',
+            'accepted', 'time_elapsed'))
+    if not rows:
+        return Rounds(*[np.zeros(0, dtype=t) for t in
+                        (np.int32, np.int8, np.int16, bool, bool, np.int32)])
+    player, kind, amount, intentional, accepted, time = zip(*rows)
+    return Rounds(np.array(player, dtype=np.int32), encode_kinds(kind),
+                  np.array(amount, dtype=np.int16), np.array(intentional, dtype=bool),
+                  np.array(accepted, dtype=bool), np.array(time, dtype=np.int32))
+
+def load_answers():
+    """Load the answers of all players that finished the game (from both
+    Answer rows and AnswerSheets)."""
+    questions = get_questionnaire().questions
+    rows = []
+    for using in databases():
+        rows.extend(finished_answers(using))
+    players = np.unique([r[0] for r in rows]).astype(np.int32)
+    answers = np.full((len(players), len(questions)), -1, dtype=np.int8)
+    if rows:
+        player, question, option = [np.array(c) for c in zip(*rows)]
+
+        # Lookup tables from question and option ids to indices.
+        question_index = np.full(max(question.max(), max(q.id for q in questions)) + 1,
+                                 -1, dtype=np.int32)
+        option_index = np.full(max([option.max()] + [o[0] for q in questions for o in q.options]) + 1,
+                               -1, dtype=np.int8)
+        for j, q in enumerate(questions):
+            question_index[q.id] = j
+            for i, o in enumerate(q.options):
+                option_index[o[0]] = i
+
+        known = question_index[question] >= 0
+        answers[np.searchsorted(players, player[known]),
+                question_index[question[known]]] = option_index[option[known]]
+    return Answers(players, questions, answers)
+
+def load_columns(directory):
+    """Load the rounds and answers of a columnar export (see game.columnar)."""
+    with open(os.path.join(directory, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+
+    def column(c):
+        if not schema['rows']:
+            return np.zeros(0, dtype=c['dtype'])
+        return np.memmap(os.path.join(directory, c['file']), dtype=c['dtype'],
+                         mode='r', shape=(schema['rows'],))
+
+    columns = dict((c['name'], column(c)) for c in schema['columns'])
+    rounds = Rounds(columns['player'],
+                    encode_kinds(columns['opponent_kind']),
+                    columns['amount_offered'], columns['is_intentional'],
+                    columns['accepted'], columns['round_time'])
+
+    # The columns hold one answer per round; keep the first round per player.
+    players, first = np.unique(rounds.player, return_index=True)
+    questions = get_questionnaire().questions
+    by_id = dict((c['question'], column(c)) for c in schema['questions'])
+    answers = np.full((len(players), len(questions)), -1, dtype=np.int8)
+    for j, q in enumerate(questions):
+        if q.id in by_id:
+            answers[:, j] = by_id[q.id][first]
+    return rounds, Answers(players, questions, answers)
+
+def group(*keys):
+    """Return the distinct combinations of the given keys (one row each) and,
+    for each element, the index of its combination."""
+    combined = np.column_stack(keys) if keys[0].size else np.zeros((0, len(keys)))
+    groups, inverse = np.unique(combined, axis=0, return_inverse=True)
+    return groups.astype(np.int64), inverse
+
+def group_rounds(rounds):
+    return group(rounds.kind, rounds.amount_offered, rounds.is_intentional)
+
+def describe_groups(groups):
+    return [{'kind': KINDS[k], 'amount_offered': int(a), 'is_intentional': bool(i)}
+            for k, a, i in groups]
+
+def acceptance_rates(rounds, bootstrap=1000, confidence=0.95, seed=None):
+    """Return the acceptance rate per kind, amount offered and intent.
+
+    The confidence intervals are percentile intervals of the bootstrapped
+    rates. Resampling the rounds of a group with replacement and counting the
+    accepted ones amounts to drawing from a binomial distribution, so all
+    replicates of all groups are drawn in one go. Rounds are treated as
+    independent, i.e. the clustering of rounds within players is ignored.
+    """
+    groups, inverse = group_rounds(rounds)
+    n = np.bincount(inverse, minlength=len(groups))
+    accepted = np.bincount(inverse, weights=rounds.accepted, minlength=len(groups))
+    rate = accepted / np.maximum(n, 1)
+
+    rng = np.random.RandomState(seed)
+    replicates = rng.binomial(n[:, None], rate[:, None],
+                              size=(len(groups), bootstrap)) / np.maximum(n, 1)[:, None]
+    alpha = (1 - confidence) / 2 * 100
+    low, high = np.percentile(replicates, [alpha, 100 - alpha], axis=1)
+
+    table = describe_groups(groups)
+    for row, values in zip(table, zip(n, accepted, rate, low, high)):
+        row.update(zip(['n', 'accepted', 'rate', 'low', 'high'],
+                       [int(values[0]), int(values[1])] + [float(v) for v in values[2:]]))
+    return table
+
+def response_times(rounds, percentiles=(5, 25, 50, 75, 95)):
+    """Return the mean and percentiles of the time taken per round (in ms),
+    per kind, amount offered and intent."""
+    groups, inverse = group_rounds(rounds)
+    n = np.bincount(inverse, minlength=len(groups))
+    time = rounds.time_elapsed.astype(np.float64)
+    mean = np.bincount(inverse, weights=time, minlength=len(groups)) / np.maximum(n, 1)
+
+    # Sort by group, then by time; each group is then a contiguous run, in
+    # which the percentiles are found by linear interpolation.
+    ordered = time[np.lexsort((time, inverse))]
+    start = np.cumsum(n) - n
+    values = []
+    for p in percentiles:
+        position = start + (n - 1) * (p / 100.0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, start + n - 1)
+        fraction = position - lower
+        values.append(ordered[lower] * (1 - fraction) + ordered[upper] * fraction
+                      if len(ordered) else np.zeros(len(groups)))
+
+    table = describe_groups(groups)
+    for i, row in enumerate(table):
+        row['n'] = int(n[i])
+        row['mean'] = float(mean[i])
+        for p, v in zip(percentiles, values):
+            row['p%d' % p] = float(v[i])
+    return table
+
+def questionnaire_scores(answers):
+    """Return the score of every player on every answer scale.
+
+    Questions with the same options form a scale. A player's score on a scale
+    is the mean index of the chosen options, normalized to [0, 1], over the
+    questions of the scale the player answered (NaN if none). Return the
+    scales, as (options, question ids) pairs, and a players x scales array.
+    """
+    scales = []
+    scale_of = {}
+    for q in answers.questions:
+        options = tuple(o[1] for o in q.options)
+        if options not in scale_of:
+            scale_of[options] = len(scales)
+            scales.append((options, []))
+        scales[scale_of[options]][1].append(q.id)
+
+    # membership[j, s]: whether question j belongs to scale s.
+    membership = np.zeros((len(answers.questions), len(scales)))
+    maximum = np.ones(len(answers.questions))
+    for j, q in enumerate(answers.questions):
+        membership[j, scale_of[tuple(o[1] for o in q.options)]] = 1
+        maximum[j] = max(len(q.options) - 1, 1)
+
+    answered = answers.answers >= 0
+    normalized = np.where(answered, answers.answers / maximum, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = normalized.dot(membership) / answered.dot(membership)
+    return scales, scores
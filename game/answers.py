@@ -0,0 +1,203 @@
+"""Storage of the answers to the questionnaire.
+
+Answers are stored in one of two ways, as configured by the GAME_ANSWER_STORAGE
+setting:
+
+* 'rows': one Answer row per question a player answered;
+* 'sheets': one AnswerSheet row per player, holding the index of the chosen
+  option of every question as a single character, in question order ('-' for
+  questions not answered yet), e.g. '3511-----'.
+
+The order of the questions and their options that a sheet follows is given by
+its QuestionnaireVersion, which is created when the first sheet of a layout is
+saved, so sheets stay readable after the questionnaire changes. A sheet keeps
+its layout while the participant fills in the questionnaire, unless answers to
+new questions require the current one.
+
+The helpers below read both, so that switching (see the convert_answers
+command) does not require any downtime.
+"""
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+from game.models import Answer, AnswerSheet, QuestionnaireVersion
+from game.questionnaire import get_questionnaire
+
+DEFAULT_STORAGE = 'rows'
+
+# The characters for the option indices, and for no answer.
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+NO_ANSWER = '-'
+
+def on(queryset, using):
+    return queryset if using is None else queryset.using(using)
+
+class AnswerSheetError(Exception):
+    pass
+
+def get_storage():
+    return getattr(settings, 'GAME_ANSWER_STORAGE', DEFAULT_STORAGE)
+
+# The layouts of the QuestionnaireVersions seen by this process, by id. As a
+# layout never changes, they are never reloaded.
+_layouts = {}
+
+def get_current_version():
+    """Return the id and layout of the current questionnaire, making sure its
+    QuestionnaireVersion exists."""
+    questionnaire = get_questionnaire()
+    if questionnaire.layout_id not in _layouts:
+        QuestionnaireVersion.objects.get_or_create(
+            id=questionnaire.layout_id, defaults={'layout': json.dumps(questionnaire.layout)})
+        _layouts[questionnaire.layout_id] = questionnaire.layout
+    return questionnaire.layout_id, questionnaire.layout
+
+def get_layouts(version_ids, using=None):
+    """Return {version id: layout} for the given version ids."""
+    missing = set(version_ids) - set(_layouts)
+    if missing:
+        for version in on(QuestionnaireVersion.objects.filter(id__in=missing), using):
+            _layouts[version.id] = version.get_layout()
+    return dict((v, _layouts[v]) for v in version_ids)
+
+def encode(layout, answers):
+    """Encode the given {question id: option id} along the given layout.
+    Answers to questions or options that are not in the layout are left out."""
+    chars = []
+    for question_id, option_ids in layout:
+        option_id = answers.get(question_id)
+        if option_id in option_ids:
+            chars.append(DIGITS[option_ids.index(option_id)])
+        else:
+            chars.append(NO_ANSWER)
+    return ''.join(chars)
+
+def fits(layout, answers):
+    """Return whether all of the given {question id: option id} can be
+    encoded along the given layout."""
+    options = dict(layout)
+    return all(option_id in options.get(question_id, ()) for question_id, option_id
+               in answers.items())
+
+def decode(layout, encoded):
+    """Return {question id: option id} for the given encoded answers."""
+    answers = {}
+    for (question_id, option_ids), char in zip(layout, encoded):
+        if char != NO_ANSWER:
+            answers[question_id] = option_ids[DIGITS.index(char)]
+    return answers
+
+@transaction.commit_on_success
+def save_answers(player, answers):
+    """Save the given (unsaved) Answers of a player, e.g. to a page of the
+    questionnaire, in one go.
+
+    Answers the player gave to the same questions before (i.e. when the page is
+    submitted again) are replaced, so that a question is answered only once.
+    A sheet is never re-encoded along a layout that would lose any of its
+    answers; AnswerSheetError is raised instead.
+    """
+    if get_storage() == 'sheets':
+        # Lock the sheet, so concurrent pages of the same player don't lose
+        # each other's answers.
+        try:
+            sheet = AnswerSheet.objects.select_for_update().get(player=player)
+        except AnswerSheet.DoesNotExist:
+            sheet = None
+            previous = {}
+        else:
+            version = sheet.version_id
+            layout = get_layouts([version])[version]
+            previous = decode(layout, sheet.answers)
+        previous.update((a.question_id, a.option_id) for a in answers)
+        if sheet is None or not fits(layout, previous):
+            # A new sheet, or the questionnaire changed since the sheet was
+            # started and the new answers are not in its layout.
+            version, layout = get_current_version()
+            if not fits(layout, previous):
+                raise AnswerSheetError('The answers of %s do not fit the current '
+                                       'questionnaire.' % player)
+        if sheet is None:
+            AnswerSheet.objects.create(player=player, version_id=version,
+                                       answers=encode(layout, previous))
+        else:
+            sheet.version_id = version
+            sheet.answers = encode(layout, previous)
+            sheet.save(update_fields=['version', 'answers'])
+    else:
+        Answer.objects.filter(player=player,
+                              question__in=[a.question_id for a in answers]).delete()
+        Answer.objects.bulk_create(answers)
+
+def get_sheet_answers(sheets, using=None):
+    """Return {player id: {question id: option id}} for the given
+    (player id, version id, encoded answers) triples, read from the given
+    database."""
+    sheets = list(sheets)
+    layouts = get_layouts(set(s[1] for s in sheets), using)
+    return dict((player_id, decode(layouts[version], encoded))
+                for player_id, version, encoded in sheets)
+
+def get_answers(player_ids, using=None):
+    """Return {player id: {question id: option id}} for the given players,
+    from the given database (see game.archive)."""
+    answers = get_sheet_answers(on(AnswerSheet.objects.filter(
+        player__in=player_ids), using).values_list('player', 'version', 'answers'), using)
+    for player_id, question_id, option_id in on(Answer.objects.filter(
+            player__in=player_ids), using).values_list('player', 'question', 'option'):
+        answers.setdefault(player_id, {})[question_id] = option_id
+    return answers
+
+def finished_answers(using=None):
+    """Return the answers of all players in the given database that finished
+    the game, as (player id, question id, option id) triples."""
+    rows = list(on(Answer.objects.exclude(player__mturk_key='0'), using).values_list(
+        'player', 'question', 'option'))
+    sheets = get_sheet_answers(on(AnswerSheet.objects.exclude(player__mturk_key='0'),
+                                  using).values_list('player', 'version', 'answers'), using)
+    for player_id, answers in sheets.items():
+        rows.extend((player_id, q, o) for q, o in answers.items())
+    return rows
+
+def convert_rows(chunk_size=500):
+    """Move the answers stored as Answer rows to AnswerSheets following the
+    current layout, chunk_size players at a time (each in a transaction).
+    Players with answers that are not in the current layout keep their rows.
+    Return the number of players converted and the ids of those skipped."""
+    version, layout = get_current_version()
+    converted, skipped = 0, []
+    last = 0
+    while True:
+        player_ids = list(Answer.objects.filter(player__gt=last).order_by('player').values_list(
+            'player', flat=True).distinct()[:chunk_size])
+        if not player_ids:
+            return converted, skipped
+        last = player_ids[-1]
+
+        with transaction.commit_on_success():
+            rows = {}
+            for player_id, question_id, option_id in Answer.objects.filter(
+                    player__in=player_ids).values_list('player', 'question', 'option'):
+                rows.setdefault(player_id, {})[question_id] = option_id
+            sheets = get_sheet_answers(AnswerSheet.objects.select_for_update().filter(
+                player__in=player_ids).values_list('player', 'version', 'answers'))
+
+            new_sheets, done = [], []
+            for player_id in player_ids:
+                answers = dict(sheets.get(player_id, {}))
+                answers.update(rows[player_id])
+                if not fits(layout, answers):
+                    skipped.append(player_id)
+                    continue
+                if player_id in sheets:
+                    AnswerSheet.objects.filter(player=player_id).update(
+                        version=version, answers=encode(layout, answers))
+                else:
+                    new_sheets.append(AnswerSheet(player_id=player_id, version_id=version,
+                                                  answers=encode(layout, answers)))
+                done.append(player_id)
+            AnswerSheet.objects.bulk_create(new_sheets)
+            Answer.objects.filter(player__in=done).delete()
+        converted += len(done)
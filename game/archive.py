@@ -0,0 +1,183 @@
+"""Archives of the players of completed waves of a study.
+
+archive_wave() moves the players that registered in a given period (by default
+only those that finished the game), along with their rounds and answers, from
+the live database to an archive: a SQLite file of its own, named after the
+wave, in GAME_ARCHIVE_DIR. The live tables, and with them their indexes and
+every aggregate over them, then only hold the current wave.
+
+Archives have the same tables as the live database, so the same queries run on
+either. Each archive is available as a database of its own (see databases());
+the export and the analysis read all of them along with the live database, and
+their queries name the database they run on with using().
+
+Archiving leaves the KindCounters and the dashboard's SummaryCounters alone, as
+they count all participants of the study.
+"""
+import os
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections, transaction
+
+from game.models import (Answer, AnswerSheet, Kind, Opponent, Option, Player, Question,
+                         QuestionnaireVersion, Round)
+
+ARCHIVE_DIR = getattr(settings, 'GAME_ARCHIVE_DIR',
+                      os.path.join(os.path.dirname(os.path.dirname(__file__)), 'archives'))
+EXTENSION = '.sqlite3'
+# Wave names double as file names and database aliases.
+NAME_RE = re.compile(r'^[A-Za-z0-9_]+$')
+
+CHUNK_SIZE = 500
+
+# The state of the players to archive.
+FINISHED = 'finished'
+UNFINISHED = 'unfinished'
+ALL = 'all'
+
+# The models copied as a whole to every archive, so that the rows of the
+# players can be read on their own.
+REFERENCE_MODELS = [Kind, Opponent, Question, Option, QuestionnaireVersion]
+# The models holding the rows of the players, along with the field that refers
+# to the player.
+PLAYER_MODELS = [(Player, 'id'), (Round, 'player'), (Answer, 'player'),
+                 (AnswerSheet, 'player')]
+
+class ArchiveError(Exception):
+    pass
+
+def get_alias(name):
+    return 'archive_%s' % name
+
+def get_path(name):
+    return os.path.join(ARCHIVE_DIR, name + EXTENSION)
+
+def list_archives():
+    """Return the names of all archives, in order."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted(f[:-len(EXTENSION)] for f in os.listdir(ARCHIVE_DIR)
+                  if f.endswith(EXTENSION) and NAME_RE.match(f[:-len(EXTENSION)]))
+
+def open_archive(name):
+    """Make the archive with the given name available as a database, and
+    return its alias."""
+    alias = get_alias(name)
+    if alias not in connections.databases:
+        connections.databases[alias] = {'ENGINE': 'django.db.backends.sqlite3',
+                                        'NAME': get_path(name)}
+    return alias
+
+def databases():
+    """Return the databases to read the study's data from: the alias of every
+    archive, oldest wave first, followed by None for the live database."""
+    return [open_archive(name) for name in list_archives()] + [None]
+
+def create_archive(name):
+    """Create the tables of a new archive and return its alias."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        os.makedirs(ARCHIVE_DIR)
+    alias = open_archive(name)
+    call_command('syncdb', database=alias, interactive=False, load_initial_data=False,
+                 verbosity=0)
+    return alias
+
+@contextmanager
+def keeping_timestamps(model):
+    """Make saving instances of the given model keep the values of its
+    auto_now and auto_now_add fields, instead of setting them to the current
+    time, so that copies keep them. Not thread-safe."""
+    fields = [f for f in model._meta.fields
+              if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+    flags = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, flags):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+def copy_rows(alias, model, rows):
+    with keeping_timestamps(model):
+        model.objects.using(alias).bulk_create(rows, CHUNK_SIZE)
+
+def copy_reference_rows(alias):
+    """Copy the rows of the REFERENCE_MODELS that the archive lacks."""
+    with transaction.commit_on_success(using=alias):
+        for model in REFERENCE_MODELS:
+            present = set(model.objects.using(alias).values_list('pk', flat=True))
+            copy_rows(alias, model, [o for o in model.objects.all() if o.pk not in present])
+
+def players_to_archive(since=None, until=None, state=FINISHED):
+    players = Player.objects.all()
+    if since is not None:
+        players = players.filter(registration_datetime__gte=since)
+    if until is not None:
+        players = players.filter(registration_datetime__lt=until)
+    if state == FINISHED:
+        players = players.exclude(mturk_key='0')
+    elif state == UNFINISHED:
+        players = players.filter(mturk_key='0')
+    return players
+
+def get_identities(players):
+    """Return {player id: (registration datetime, MTurk key)} for the given
+    players."""
+    return dict((p[0], p[1:]) for p in players.values_list(
+        'id', 'registration_datetime', 'mturk_key'))
+
+def move_players(alias, player_ids):
+    """Copy the given players, with their rows, to the archive (unless they
+    are there already, e.g. after an interrupted run), then delete them from
+    the live database.
+
+    Ids can be reused (by SQLite, or by MySQL before 8.0 after a restart), so a
+    player in the archive is only taken for the live player with the same id if
+    it registered at the same time and got the same MTurk key. Otherwise
+    ArchiveError is raised, before anything is deleted.
+    """
+    with transaction.commit_on_success(using=alias):
+        present = get_identities(Player.objects.using(alias).filter(id__in=player_ids))
+        if present:
+            live = get_identities(Player.objects.filter(id__in=present))
+            for player_id in sorted(present):
+                if live.get(player_id, present[player_id]) != present[player_id]:
+                    raise ArchiveError('The archive holds another player with id %d, as '
+                                       'the id has been reused; archive the players to a '
+                                       'new wave instead.' % player_id)
+        new_ids = [i for i in player_ids if i not in present]
+        if new_ids:
+            for model, field in PLAYER_MODELS:
+                copy_rows(alias, model, list(model.objects.filter(**{field + '__in': new_ids})))
+    # Only once the archive holds them.
+    with transaction.commit_on_success():
+        Player.objects.filter(id__in=player_ids).delete()
+
+def archive_wave(name, since=None, until=None, state=FINISHED, chunk_size=CHUNK_SIZE):
+    """Move the players that registered from since up to until (and are in
+    the given state) to the archive with the given name, chunk_size players
+    at a time. An existing archive is added to. Return the number of players
+    moved."""
+    if not NAME_RE.match(name):
+        raise ArchiveError('An archive name may only hold letters, digits and underscores.')
+    if name in list_archives():
+        alias = open_archive(name)
+    else:
+        alias = create_archive(name)
+    copy_reference_rows(alias)
+
+    players = players_to_archive(since, until, state)
+    moved = 0
+    last = 0
+    while True:
+        player_ids = list(players.filter(id__gt=last).order_by('id').values_list(
+            'id', flat=True)[:chunk_size])
+        if not player_ids:
+            return moved
+        last = player_ids[-1]
+        move_players(alias, player_ids)
+        moved += len(player_ids)
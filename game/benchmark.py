@@ -0,0 +1,164 @@
+"""Benchmark of the game views against checked-in budgets.
+
+populate() fills the database with a realistically sized study: finished
+players, along with their rounds and answers. run() then lets simulated
+participants (see game.loadtest) play the whole game one after the other, and
+check() compares the number of queries and the 95th percentile wall time of
+every view with its budget, so that changes which bring back per-round or
+per-question queries are caught.
+
+explain_hot_queries() asks the database how it executes the queries the game
+and the export run most, to make sure each of them is served by an index.
+"""
+import json
+import os
+import random
+from uuid import uuid1
+
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from game import answers, loadtest, summary
+from game.models import Answer, AnswerSheet, Kind, KindCounter, Opponent, Player, Round
+from game.questionnaire import get_questionnaire
+from game.schedules import generate_schedule
+
+# The checked-in budgets, in benchmarks/ next to manage.py.
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks',
+                            'view_budgets.json')
+# The number of rows inserted per query while populating.
+BATCH_SIZE = 300
+# Time budgets are recorded with this much headroom, and are never lower than
+# MIN_BUDGET_MS, as wall times vary between machines far more than query counts.
+HEADROOM = 3.0
+MIN_BUDGET_MS = 50.0
+
+def populate(num_players, batch_size=BATCH_SIZE):
+    """Add the given number of finished players, with all their rounds and
+    answers, to the database."""
+    kinds = list(Kind.objects.all())
+    opponents = dict((k.id, list(Opponent.objects.filter(kind=k).values_list('id', flat=True)))
+                     for k in kinds)
+    questions = get_questionnaire().questions
+    if answers.get_storage() == 'sheets':
+        version, layout = answers.get_current_version()
+    next_id = (Player.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+    for start in range(0, num_players, batch_size):
+        players, rounds, rows, sheets = [], [], [], []
+        for player_id in range(next_id + start, next_id + min(start + batch_size, num_players)):
+            kind = kinds[player_id % len(kinds)]
+            schedule = generate_schedule(kind, opponents[kind.id])
+            player = Player(id=player_id, opponent_kind=kind, schedule=schedule.encode(),
+                            mturk_key=uuid1().hex, finished_datetime=timezone.now(),
+                            start_time=random.randint(5000, 60000),
+                            instructions_time=random.randint(5000, 60000),
+                            questionnaire_time=random.randint(60000, 600000),
+                            hours_a_day_you_spend_behind_a_computer=str(random.randint(0, 12)),
+                            age=str(random.randint(18, 70)), nationality='Dutch')
+            for opponent, offer, intent in zip(schedule.opponents, schedule.offers,
+                                               schedule.intents):
+                rounds.append(Round(player_id=player_id, opponent_id=opponent,
+                                    amount_offered=offer, is_intentional=intent,
+                                    accepted=random.random() < 0.6,
+                                    time_elapsed=random.randint(500, 10000)))
+            player.rounds_played = len(schedule)
+            players.append(player)
+            chosen = dict((q.id, random.choice(q.options)[0]) for q in questions)
+            if answers.get_storage() == 'sheets':
+                sheets.append(AnswerSheet(player_id=player_id, version_id=version,
+                                          answers=answers.encode(layout, chosen)))
+            else:
+                rows.extend(Answer(player_id=player_id, question_id=q, option_id=o)
+                            for q, o in chosen.items())
+        with transaction.commit_on_success():
+            Player.objects.bulk_create(players)
+            Round.objects.bulk_create(rounds, batch_size)
+            Answer.objects.bulk_create(rows, batch_size)
+            AnswerSheet.objects.bulk_create(sheets, batch_size)
+
+    # Bring the counters derived from the players up to date.
+    for kind in Kind.objects.annotate(num_players=Count('player')):
+        KindCounter.objects.filter(kind=kind).update(num_players=kind.num_players)
+    summary.rebuild()
+
+def run(participants):
+    """Let the given number of participants play the game, one at a time,
+    and return the summary of their requests (see loadtest.summarize)."""
+    samples, errors, elapsed = loadtest.run(participants, 1)
+    if errors:
+        raise errors[0]
+    return loadtest.summarize(samples)
+
+def budget_key(row):
+    return '%s %s' % (row['view'], row['method'])
+
+def read_budgets(path):
+    with open(path) as f:
+        return json.load(f)
+
+def write_budgets(path, results, headroom=HEADROOM):
+    """Record the given results as the new budgets: the maximum query counts
+    as measured, and the 95th percentile times with some headroom."""
+    budgets = dict((budget_key(r), {'queries': r['max_queries'],
+                                    'p95_ms': round(max(r['p95'] * headroom, MIN_BUDGET_MS), 1)})
+                   for r in results)
+    with open(path, 'w') as f:
+        json.dump(budgets, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def check(results, budgets):
+    """Return a description of every view that exceeds its budget."""
+    failures = []
+    for r in results:
+        budget = budgets.get(budget_key(r))
+        if budget is None:
+            failures.append('%s has no budget' % budget_key(r))
+            continue
+        if r['max_queries'] > budget['queries']:
+            failures.append('%s ran %d queries; the budget is %d' %
+                            (budget_key(r), r['max_queries'], budget['queries']))
+        if r['p95'] > budget['p95_ms']:
+            failures.append('%s took %.1f ms (95th percentile); the budget is %.1f ms' %
+                            (budget_key(r), r['p95'], budget['p95_ms']))
+    return failures
+
+def hot_queries():
+    """Return the queries the game and the export run most, with a description."""
+    return [
+        ('Player by id', Player.objects.filter(id=1)),
+        ('Rounds of a player', Round.objects.filter(player=1)),
+        ('Rounds of a player with an intent', Round.objects.filter(player=1, is_intentional=True)),
+        ('Round of a player against an opponent', Round.objects.filter(player=1, opponent=1)),
+        ('Answers of a player to a page of questions',
+         Answer.objects.filter(player=1, question__in=[1, 2, 3, 4, 5])),
+        ('Answers of a chunk of players', Answer.objects.filter(player__in=[1, 2, 3])),
+        ('Answer sheets of a chunk of players', AnswerSheet.objects.filter(player__in=[1, 2, 3])),
+        ('Chunk of rounds', Round.objects.filter(id__gt=1).order_by('id')[:1000]),
+        ('Players that finished since', Player.objects.filter(finished_datetime__gt=timezone.now())),
+    ]
+
+def explain(queryset):
+    """Return the plan of the given query, as lines of text, and whether all
+    tables in it are accessed through an index."""
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    if connection.vendor == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = [row[-1] for row in cursor.fetchall()]
+        uses_index = not any(line.startswith('SCAN') and 'USING' not in line
+                             for line in plan)
+    elif connection.vendor == 'mysql':
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [c[0] for c in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        plan = ['%(table)s: type=%(type)s key=%(key)s rows=%(rows)s' % r for r in rows]
+        uses_index = all(r['type'] != 'ALL' for r in rows)
+    else:
+        raise NotImplementedError('Cannot explain queries on %s' % connection.vendor)
+    return plan, uses_index
+
+def explain_hot_queries():
+    """Return (description, plan, uses_index) for every hot query."""
+    return [(description,) + explain(queryset) for description, queryset in hot_queries()]
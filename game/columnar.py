@@ -0,0 +1,106 @@
+"""Columnar export of the rounds played by the players that finished the game.
+
+The export is a directory holding one file of fixed-width binary values per
+column, plus schema.json describing them. Each column is a plain array in the
+byte order of the exporting machine, whose type is given in NumPy notation, so
+analysis code can map the columns without parsing anything:
+
+    schema = json.load(open('results/schema.json'))
+    columns = dict((c['name'], numpy.memmap('results/' + c['file'], dtype=c['dtype'],
+                                            mode='r', shape=(schema['rows'],)))
+                   for c in schema['columns'] + schema['questions'])
+
+For every question there's a column with the index of the chosen option within
+the question's options (or -1 if the question was not answered); the schema
+lists the texts of the question and its options.
+"""
+import json
+import os
+import sys
+from array import array
+
+from game.answers import get_answers
+from game.export import CHUNK_SIZE, all_finished_rounds, iter_all_chunks
+from game.questionnaire import get_questionnaire
+
+SCHEMA_FILE = 'schema.json'
+
+# The array typecode and corresponding NumPy type of each kind of column.
+BYTE_ORDER = '<' if sys.byteorder == 'little' else '>'
+TYPES = {
+    'int': ('i', BYTE_ORDER + 'i4'),
+    'short': ('h', BYTE_ORDER + 'i2'),
+    'byte': ('b', '|i1'),
+    'bool': ('B', '|b1'),
+    'char': ('c', '|S1'),
+}
+
+# The columns taken from each round and its player, along with their types.
+COLUMNS = [
+    ('player', 'int', lambda r: r.player_id),
+    ('round', 'int', lambda r: r.id),
+    ('opponent', 'int', lambda r: r.opponent_id),
+    ('opponent_kind', 'char', lambda r: str(r.player.opponent_kind_id)),
+    ('amount_offered', 'short', lambda r: r.amount_offered),
+    ('is_intentional', 'bool', lambda r: r.is_intentional),
+    ('accepted', 'bool', lambda r: r.accepted),
+    ('start_time', 'int', lambda r: r.player.start_time),
+    ('instructions_time', 'int', lambda r: r.player.instructions_time),
+    ('round_time', 'int', lambda r: r.time_elapsed),
+    ('questionnaire_time', 'int', lambda r: r.player.questionnaire_time),
+]
+
+class ColumnWriter(object):
+    def __init__(self, directory, name, type):
+        self.name = name
+        self.file_name = name + '.bin'
+        self.typecode, self.dtype = TYPES[type]
+        self.file = open(os.path.join(directory, self.file_name), 'wb')
+
+    def write(self, values):
+        array(self.typecode, values).tofile(self.file)
+
+    def close(self):
+        self.file.close()
+
+def export_columns(directory, rounds=None, chunk_size=CHUNK_SIZE):
+    """Export the given rounds (by default: all finished ones, archived or
+    live) to columns in the given directory. Return the number of rounds
+    written."""
+    if rounds is None:
+        rounds = all_finished_rounds()
+    questions = get_questionnaire().questions
+    option_indices = dict((o[0], i) for q in questions for i, o in enumerate(q.options))
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    writers = [ColumnWriter(directory, name, type) for name, type, _ in COLUMNS]
+    question_writers = [ColumnWriter(directory, 'q%d' % q.id, 'byte') for q in questions]
+
+    count = 0
+    try:
+        for using, chunk in iter_all_chunks(rounds, chunk_size):
+            for writer, (_, _, get) in zip(writers, COLUMNS):
+                writer.write([get(r) for r in chunk])
+            answers = get_answers(set(r.player_id for r in chunk), using)
+            for writer, q in zip(question_writers, questions):
+                writer.write([option_indices.get(answers.get(r.player_id, {}).get(q.id), -1)
+                              for r in chunk])
+            count += len(chunk)
+    finally:
+        for writer in writers + question_writers:
+            writer.close()
+
+    schema = {
+        'rows': count,
+        'columns': [{'name': w.name, 'file': w.file_name, 'dtype': w.dtype}
+                    for w in writers],
+        'questions': [{'name': w.name, 'file': w.file_name, 'dtype': w.dtype,
+                       'question': q.id, 'text': q.text,
+                       'options': [o[1] for o in q.options]}
+                      for w, q in zip(question_writers, questions)],
+    }
+    with open(os.path.join(directory, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=2)
+
+    return count
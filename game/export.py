@@ -0,0 +1,185 @@
+"""Export of the rounds played by the players that finished the game.
+
+Rounds are read in chunks of consecutive ids, each along with its player. The
+answers of all players in a chunk are fetched with a single query, and option
+texts are looked up in the cached questionnaire. Exporting thus costs two
+queries per chunk, and rows are written as they are produced, so memory use
+does not grow with the number of participants.
+
+An export can also be incremental: it then only appends the rounds of the
+players that finished since the previous export to the same file. The time up
+to which players have been exported (the watermark) is kept in a file next to
+the export, along with the size of the export at that time.
+"""
+import csv
+import json
+import os
+import shutil
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from game import archive, replica
+from game.answers import get_answers
+from game.models import Round
+from game.questionnaire import get_questionnaire
+
+# The number of rounds read per chunk.
+CHUNK_SIZE = 1000
+# Players that finished less than this long ago are left for the next export,
+# as the transactions that finished them might not have been committed yet.
+SETTLE_TIME = timedelta(seconds=10)
+
+# The columns preceding those of the questions (one per question, in order).
+# 'round' is the id of the round and 'round_time' its time_elapsed, as it's
+# not clear what these refer to otherwise.
+COLUMNS = ['player', 'round', 'opponent', 'opponent_kind', 'accepted',
+           'amount_offered', 'is_intentional', 'start_time', 'instructions_time',
+           'round_time', 'questionnaire_time', 'age',
+           'hours_a_day_you_spend_behind_a_computer', 'nationality']
+
+class ExportError(Exception):
+    pass
+
+def finished_rounds(since=None, until=None, using=None):
+    """Return the rounds of all players that finished the questionnaire, in
+    the given database (by default the live one; see game.archive).
+
+    If given, only players that finished after since and no later than until
+    are taken into account. Players that finished before their finishing time
+    was recorded are only included if since is not given.
+    """
+    rounds = Round.objects.exclude(player__mturk_key='0')
+    if using is not None:
+        rounds = rounds.using(using)
+    if since is not None:
+        rounds = rounds.filter(player__finished_datetime__gt=since)
+    if until is not None:
+        rounds = rounds.filter(Q(player__finished_datetime__lte=until) |
+                               Q(player__finished_datetime__isnull=True))
+    return rounds
+
+def all_finished_rounds(since=None, until=None):
+    """Return the finished rounds of every archive and of the live database,
+    as a list of querysets (see finished_rounds)."""
+    return [finished_rounds(since, until, using) for using in archive.databases()]
+
+def iter_chunks(rounds, chunk_size=CHUNK_SIZE):
+    """Yield the given rounds, along with their players, in chunks."""
+    rounds = rounds.select_related('player').order_by('id')
+    last = 0
+    while True:
+        chunk = list(rounds.filter(id__gt=last)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1].id
+
+def iter_all_chunks(rounds, chunk_size=CHUNK_SIZE):
+    """Yield the given rounds (a queryset or a list of them) in chunks, each
+    along with the database it was read from."""
+    for queryset in rounds if isinstance(rounds, list) else [rounds]:
+        for chunk in iter_chunks(queryset, chunk_size):
+            yield queryset.db, chunk
+
+def iter_rows(rounds, questions, chunk_size=CHUNK_SIZE):
+    """Yield one row of values, in the order of COLUMNS and the given
+    questions, for each of the given rounds (a queryset or a list of them)."""
+    option_texts = dict(o for q in questions for o in q.options)
+    for using, chunk in iter_all_chunks(rounds, chunk_size):
+        answers = get_answers(set(r.player_id for r in chunk), using)
+        for r in chunk:
+            p = r.player
+            given = answers.get(p.id, {})
+            row = [p.id, r.id, r.opponent_id, p.opponent_kind_id, r.accepted,
+                   r.amount_offered, r.is_intentional, p.start_time,
+                   p.instructions_time, r.time_elapsed, p.questionnaire_time,
+                   p.age, p.hours_a_day_you_spend_behind_a_computer, p.nationality]
+            row.extend(option_texts.get(given.get(q.id)) for q in questions)
+            yield row
+
+def encode(row):
+    return [v.encode('utf-8') if isinstance(v, unicode) else v for v in row]
+
+def get_header(questions):
+    return encode(COLUMNS + [q.text for q in questions])
+
+def write_csv(f, rows, questions, header=True):
+    """Write the given rows to f; return the number of rows written."""
+    writer = csv.writer(f)
+    if header:
+        writer.writerow(get_header(questions))
+    count = 0
+    for row in rows:
+        writer.writerow(encode(row))
+        count += 1
+    return count
+
+def export_csv(f, rounds=None, chunk_size=CHUNK_SIZE, header=True):
+    """Export the given rounds (by default: all finished ones, archived or
+    live) to f."""
+    if rounds is None:
+        rounds = all_finished_rounds()
+    questions = get_questionnaire().questions
+    return write_csv(f, iter_rows(rounds, questions, chunk_size), questions, header)
+
+def get_watermark_path(path):
+    return path + '.watermark'
+
+def read_watermark(path):
+    """Return the watermark of the export at path and the size of the export
+    when it was written, or (None, None) if there is none."""
+    try:
+        with open(get_watermark_path(path)) as f:
+            watermark = json.load(f)
+    except IOError:
+        return None, None
+    return parse_datetime(watermark['finished_datetime']), watermark.get('size')
+
+def write_watermark(path, watermark, size):
+    tmp_path = get_watermark_path(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'finished_datetime': watermark.isoformat(), 'size': size}, f)
+    os.rename(tmp_path, get_watermark_path(path))
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        return next(csv.reader(f), None)
+
+def export_file(path, incremental=False, chunk_size=CHUNK_SIZE):
+    """Export the finished rounds to the CSV file at path.
+
+    If incremental and the file has been exported to before, only the rounds
+    of the players that finished since are appended; otherwise the file is
+    rebuilt from scratch. Return the number of rounds written.
+
+    The export is written to a temporary file, which replaces the file at path
+    once complete. An incremental export starts from a copy of the file as it
+    was when the watermark was written, so rounds appended by an export that
+    failed before writing its watermark are not appended twice. It is refused
+    if the questions changed since the file was started.
+    """
+    until = timezone.now() - SETTLE_TIME - replica.get_lag()
+    if incremental and os.path.exists(path):
+        since, size = read_watermark(path)
+    else:
+        since, size = None, None
+    if since is not None and read_header(path) != get_header(get_questionnaire().questions):
+        raise ExportError('The questions have changed since %s was started; export it '
+                          'again without --incremental.' % path)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        if since is not None:
+            with open(path, 'rb') as previous:
+                shutil.copyfileobj(previous, f)
+            if size is not None:
+                f.seek(size)
+                f.truncate()
+        count = export_csv(f, all_finished_rounds(since, until), chunk_size,
+                           header=since is None)
+    os.rename(tmp_path, path)
+    write_watermark(path, until, os.path.getsize(path))
+    return count
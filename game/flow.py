@@ -0,0 +1,88 @@
+"""A participant's progress through the game, as kept in the session.
+
+All flow state (the player, the current opponent, the timings and the progress
+through the intentionality pages and the questionnaire) is kept as a single
+compact record under one session key, instead of as separate session keys.
+The record is only replaced, and thereby the session only saved, when a value
+actually changes, so most requests do not write the session at all.
+
+The record carries a version number. Sessions holding a record of another
+version, or the separate keys used before records were introduced, are
+converted when they are first read.
+"""
+
+SESSION_KEY = 'g'
+VERSION = 1
+
+# The short keys of the values in the record.
+KEYS = {
+    'player_id': 'p',
+    'opponent_id': 'o',
+    'start_time': 's',
+    'instructions_time': 'i',
+    'questionnaire_time': 'qt',
+    'viewed_intentionality': 'vi',
+    'page': 'q',
+    'finished': 'f',
+}
+
+class FlowState(object):
+    """Dict-like access to the flow state in a session, by (long) name."""
+
+    def __init__(self, session):
+        self.session = session
+        record = session.get(SESSION_KEY)
+        if not record or record.get('v') != VERSION:
+            record = self.convert(session, record)
+        self.record = record
+
+    def convert(self, session, record):
+        """Return the current record for an old (or missing) one."""
+        new = {'v': VERSION}
+        for name, key in KEYS.items():
+            if record and key in record:
+                new[key] = record[key]
+            elif name in session:
+                new[key] = session[name]
+        if len(new) > 1:
+            self.save(new)
+        for name in KEYS:
+            if name in session:
+                del session[name]
+        return new
+
+    def save(self, record):
+        self.record = record
+        self.session[SESSION_KEY] = record
+
+    def get(self, name, default=None):
+        value = self.record.get(KEYS[name], default)
+        # Hand out copies, so changes only take effect when they are set.
+        return list(value) if isinstance(value, list) else value
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return self.get(name)
+
+    def __contains__(self, name):
+        return KEYS[name] in self.record
+
+    def __setitem__(self, name, value):
+        key = KEYS[name]
+        if key in self.record and self.record[key] == value:
+            return
+        record = dict(self.record)
+        record[key] = value
+        self.save(record)
+
+    def __delitem__(self, name):
+        record = dict(self.record)
+        del record[KEYS[name]]
+        self.save(record)
+
+def get_flow_state(request):
+    """Return the FlowState shared by everything handling this request."""
+    if not hasattr(request, 'flow_state'):
+        request.flow_state = FlowState(request.session)
+    return request.flow_state
@@ -1,4 +1,4 @@
-from django.forms import Form, ModelForm, BooleanField, RadioSelect, HiddenInput
+from django.forms import Form, ModelForm, BooleanField, RadioSelect, HiddenInput, TypedChoiceField
 
 from game.models import Kind, Opponent, Player, Round, Question, Option, Answer
 
@@ -8,15 +8,22 @@ class OfferAcceptanceForm(ModelForm):
         fields = ['accepted', 'time_elapsed']
         widgets = { 'accepted': RadioSelect, 'time_elapsed' : HiddenInput }
 
-class QuestionnaireForm(ModelForm):
-    class Meta:
-        model = Answer
-        fields = ['option']
-        widgets = { 'option': RadioSelect }
-    
-    #def clean_option(self):
-    #    option = self.cleaned_data['option']
-    #    return Option.objects.get(id=option)
+class QuestionnaireForm(Form):
+    """Form for the answer to a single (cached) question of the questionnaire.
+
+    The options are taken from game.questionnaire, so neither rendering nor
+    validating the form queries the database.
+    """
+    option = TypedChoiceField(coerce=int, widget=RadioSelect)
+
+    def __init__(self, question, *args, **kwargs):
+        super(QuestionnaireForm, self).__init__(*args, **kwargs)
+        self.question = question
+        self.fields['option'].choices = question.options
+
+    def get_answer(self, player):
+        return Answer(player=player, question_id=self.question.id,
+                      option_id=self.cleaned_data['option'])
 
 class ReadForm(Form):
     checked = BooleanField(label='Check this box if you have read this carefully')
@@ -0,0 +1,106 @@
+"""Web-ready variants of the opponent pictures and instruction images.
+
+build() writes a resized and recompressed copy of every image under the static
+directories in SOURCES to game/static/game/variants, named after a hash of its
+contents, and lists them in a manifest. As the name of a variant changes
+whenever its contents do, variants can be cached by browsers for as long as
+they like (see the README for the server configuration). Templates refer to
+the variant of an image with the image tag of the game_images library, which
+falls back to the original image when no variant has been built.
+
+Building variants requires PIL (or Pillow); serving them does not.
+"""
+import hashlib
+import json
+import os
+from io import BytesIO
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+# Variants are written to this directory, relative to STATIC_DIR.
+VARIANTS_DIR = 'game/variants'
+MANIFEST_FILE = os.path.join(STATIC_DIR, VARIANTS_DIR, 'manifest.json')
+
+# The variants to build of the images in each directory (relative to
+# STATIC_DIR): (name, maximum width and height, format, save options). The
+# 'colors' option reduces the image to a palette of that many colors, which
+# suits the flat-colored instruction diagrams.
+SOURCES = {
+    'game/pictures': [
+        ('full', (240, 360), 'JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+    ],
+    'game/instructions': [
+        ('full', (430, 690), 'PNG', {'optimize': True, 'colors': 64}),
+    ],
+}
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png'}
+
+def render_variant(path, size, format, options):
+    """Return the contents of the given variant of the image at path."""
+    from PIL import Image
+
+    image = Image.open(path)
+    # thumbnail() only ever shrinks, keeping the aspect ratio.
+    image.thumbnail(size, Image.ANTIALIAS)
+    options = dict(options)
+    colors = options.pop('colors', None)
+    if colors:
+        image = image.convert('RGB').convert('P', palette=Image.ADAPTIVE, colors=colors)
+    if format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, format, **options)
+    return output.getvalue()
+
+def build():
+    """Build all variants, remove those of earlier builds and write the
+    manifest. Return the manifest: per image, the path of each variant."""
+    manifest = {}
+    written = set()
+    for directory, variants in sorted(SOURCES.items()):
+        for file_name in sorted(os.listdir(os.path.join(STATIC_DIR, directory))):
+            source = '%s/%s' % (directory, file_name)
+            base = os.path.splitext(file_name)[0]
+            for name, size, format, options in variants:
+                data = render_variant(os.path.join(STATIC_DIR, source), size, format, options)
+                digest = hashlib.md5(data).hexdigest()[:12]
+                path = '%s/%s/%s.%s.%s.%s' % (VARIANTS_DIR, os.path.basename(directory),
+                                               base, name, digest, EXTENSIONS[format])
+                full_path = os.path.join(STATIC_DIR, path)
+                if not os.path.isdir(os.path.dirname(full_path)):
+                    os.makedirs(os.path.dirname(full_path))
+                with open(full_path, 'wb') as f:
+                    f.write(data)
+                written.add(full_path)
+                manifest.setdefault(source, {})[name] = path
+
+    for directory, _, file_names in os.walk(os.path.join(STATIC_DIR, VARIANTS_DIR)):
+        for file_name in file_names:
+            full_path = os.path.join(directory, file_name)
+            if full_path not in written and full_path != MANIFEST_FILE:
+                os.remove(full_path)
+
+    with open(MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return manifest
+
+_manifest = None
+
+def get_manifest():
+    """Return the manifest, which is read once per process."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_FILE) as f:
+                _manifest = json.load(f)
+        except IOError:
+            _manifest = {}
+    return _manifest
+
+def variant_url(path, variant='full'):
+    """Return the URL of the given variant of the static image at path, or
+    of the image itself if the variant has not been built."""
+    return staticfiles_storage.url(get_manifest().get(path, {}).get(variant, path))
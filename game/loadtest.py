@@ -0,0 +1,218 @@
+"""Simulated participants, for load testing the game.
+
+A simulated participant behaves like a (very simple) browser: starting at the
+start page, it submits the form on every page it gets, filling in random
+answers, and follows the redirects it gets back, until it reaches a page
+without a form (the thank-you page). It uses the Django test client, so
+requests are handled in-process, against the configured database. Every request
+is timed, and the queries it runs are counted.
+
+compare_connections() runs the load test twice, to measure what keeping the
+database connections open between requests (see game.persistent) gains.
+"""
+import random
+import threading
+import time
+from HTMLParser import HTMLParser
+from urlparse import urlparse
+
+from django.core.urlresolvers import resolve
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.client import Client
+
+from game import persistent
+
+START_URL = '/game/start/'
+
+# The values given for text fields, by name; other text fields get 'x'.
+TEXT_VALUES = {
+    'age': lambda: str(random.randint(18, 70)),
+    'hours_a_day_you_spend_behind_a_computer': lambda: str(random.randint(0, 12)),
+    'nationality': lambda: random.choice(['Dutch', 'American', 'Indian']),
+    'time_elapsed': lambda: str(random.randint(500, 10000)),
+}
+
+# A participant that needs more requests than this is considered stuck.
+MAX_REQUESTS = 200
+
+class FormParser(HTMLParser):
+    """Finds the first form of a page, along with its fields."""
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.form = None
+        self.in_form = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form' and self.form is None:
+            self.form = {'action': attrs.get('action', ''),
+                         'method': attrs.get('method', 'get').lower(),
+                         'fields': []}
+            self.in_form = True
+        elif tag == 'input' and self.in_form and attrs.get('name'):
+            self.form['fields'].append(attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self.in_form = False
+
+def parse_form(html):
+    parser = FormParser()
+    parser.feed(html)
+    return parser.form
+
+def fill_form(form):
+    """Return the data a participant submits for the given form."""
+    data = {}
+    choices = {}
+    for field in form['fields']:
+        name, type = field['name'], field.get('type', 'text')
+        if type == 'radio':
+            choices.setdefault(name, []).append(field.get('value'))
+        elif type == 'checkbox':
+            data[name] = field.get('value', 'on')
+        elif type in ('text', 'hidden', 'number'):
+            if name in TEXT_VALUES:
+                data[name] = TEXT_VALUES[name]()
+            else:
+                data[name] = field.get('value') or 'x'
+    for name, values in choices.items():
+        data[name] = random.choice(values)
+    return data
+
+class Sample(object):
+    def __init__(self, view, method, status, elapsed, queries):
+        self.view = view
+        self.method = method
+        self.status = status
+        self.elapsed = elapsed
+        self.queries = queries
+
+class Participant(object):
+    """A single simulated participant, playing the whole game once."""
+
+    def __init__(self, think_time=0):
+        self.client = Client()
+        self.think_time = think_time
+        self.samples = []
+
+    def request(self, method, path, data=None):
+        view = resolve(urlparse(path).path).url_name
+        start = time.time()
+        response = getattr(self.client, method)(path, data or {})
+        elapsed = time.time() - start
+        self.samples.append(Sample(view, method.upper(), response.status_code,
+                                   elapsed, len(connection.queries)))
+        return response
+
+    def think(self):
+        if self.think_time:
+            time.sleep(random.uniform(0, 2 * self.think_time))
+
+    def play(self):
+        response = self.request('get', START_URL)
+        for i in range(MAX_REQUESTS):
+            if response.status_code in (301, 302, 303):
+                response = self.request('get', urlparse(response['Location']).path)
+                continue
+            if response.status_code != 200:
+                raise AssertionError('%s returned %d' % (self.samples[-1].view,
+                                                         response.status_code))
+            form = parse_form(response.content.decode('utf-8'))
+            if form is None:
+                # The end of the game.
+                return
+            self.think()
+            response = self.request(form['method'], form['action'], fill_form(form))
+        raise AssertionError('Participant did not finish in %d requests' % MAX_REQUESTS)
+
+def run(participants, concurrency, think_time=0):
+    """Let the given number of participants play the game, the given number
+    of them at a time. Return the samples of all requests, the number of
+    errors and the total time taken."""
+    pending = range(participants)
+    lock = threading.Lock()
+    samples = []
+    errors = []
+
+    def work():
+        # Record the queries of this thread's connection, even if not DEBUG.
+        connection.use_debug_cursor = True
+        while True:
+            with lock:
+                if not pending:
+                    break
+                pending.pop()
+            participant = Participant(think_time)
+            try:
+                participant.play()
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            with lock:
+                samples.extend(participant.samples)
+        connection.close()
+
+    start = time.time()
+    threads = [threading.Thread(target=work) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors, time.time() - start
+
+def compare_connections(participants, concurrency, think_time=0, max_age=None):
+    """Run the load test with the database connections closed after every
+    request, as Django does, and then with them kept open for up to max_age
+    seconds. Return for each run a label, the number of connections opened and
+    the results of run()."""
+    # The test client never closes connections itself.
+    persistent.install()
+    lock = threading.Lock()
+    opened = [0]
+
+    def count(sender, connection, **kwargs):
+        with lock:
+            opened[0] += 1
+
+    connection_created.connect(count)
+    previous = persistent.MAX_AGE
+    results = []
+    try:
+        for label, age in [('closed', 0), ('persistent', max_age)]:
+            persistent.MAX_AGE = age
+            opened[0] = 0
+            samples, errors, elapsed = run(participants, concurrency, think_time)
+            results.append((label, opened[0], samples, errors, elapsed))
+    finally:
+        persistent.MAX_AGE = previous
+        connection_created.disconnect(count)
+    return results
+
+def percentile(values, p):
+    """Return the p-th percentile of the given sorted values."""
+    if not values:
+        return 0
+    position = (len(values) - 1) * p / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize(samples):
+    """Return per view and method: the number of requests, the 50th, 95th and
+    99th percentile latency (in ms), and the mean and maximum query count."""
+    by_view = {}
+    for s in samples:
+        by_view.setdefault((s.view, s.method), []).append(s)
+    rows = []
+    for (view, method), group in sorted(by_view.items()):
+        elapsed = sorted(s.elapsed * 1000 for s in group)
+        queries = [s.queries for s in group]
+        rows.append({'view': view, 'method': method, 'requests': len(group),
+                     'p50': percentile(elapsed, 50), 'p95': percentile(elapsed, 95),
+                     'p99': percentile(elapsed, 99),
+                     'queries': float(sum(queries)) / len(queries),
+                     'max_queries': max(queries)})
+    return rows
@@ -0,0 +1,70 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.replica import replica_reads
+
+class Command(BaseCommand):
+    help = ('Computes the acceptance rates, response times and questionnaire '
+            'scores of all players that finished the game. Requires NumPy.')
+    option_list = BaseCommand.option_list + (
+        make_option('--columns', default=None,
+                    help='Analyse a columnar export (see export_results) instead '
+                         'of the database.'),
+        make_option('--bootstrap', type='int', default=1000,
+                    help='The number of bootstrap replicates (default: 1000).'),
+        make_option('--confidence', type='float', default=0.95,
+                    help='The confidence level of the intervals (default: 0.95).'),
+        make_option('--seed', type='int', default=None,
+                    help='The seed of the bootstrap.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            from game import analysis
+        except ImportError as e:
+            raise CommandError('The analysis requires NumPy: %s' % e)
+
+        start = time.time()
+        if options['columns']:
+            rounds, answers = analysis.load_columns(options['columns'])
+        else:
+            with replica_reads():
+                rounds, answers = analysis.load_rounds(), analysis.load_answers()
+        loaded = time.time()
+
+        rates = analysis.acceptance_rates(rounds, options['bootstrap'],
+                                          options['confidence'], options['seed'])
+        times = analysis.response_times(rounds)
+        scales, scores = analysis.questionnaire_scores(answers)
+        computed = time.time()
+
+        self.stdout.write('Acceptance rates (%d%% confidence intervals)' %
+                          round(options['confidence'] * 100))
+        self.stdout.write('kind  offer  intentional      n   rate    low   high')
+        for r in rates:
+            self.stdout.write('%-4s  %5d  %-11s  %5d  %.3f  %.3f  %.3f' %
+                              (r['kind'], r['amount_offered'], r['is_intentional'],
+                               r['n'], r['rate'], r['low'], r['high']))
+
+        self.stdout.write('\nResponse times (ms)')
+        self.stdout.write('kind  offer  intentional      n      mean       p5      p25      p50      p75      p95')
+        for r in times:
+            self.stdout.write('%-4s  %5d  %-11s  %5d  %8.0f %8.0f %8.0f %8.0f %8.0f %8.0f' %
+                              (r['kind'], r['amount_offered'], r['is_intentional'],
+                               r['n'], r['mean'], r['p5'], r['p25'], r['p50'],
+                               r['p75'], r['p95']))
+
+        self.stdout.write('\nQuestionnaire scales (mean normalized score over %d players)' %
+                          len(answers.players))
+        if len(answers.players):
+            means = analysis.np.nanmean(scores, axis=0)
+        else:
+            means = [float('nan')] * len(scales)
+        for (scale, question_ids), mean in zip(scales, means):
+            self.stdout.write('%.3f  %d questions: %s' %
+                              (mean, len(question_ids), ' / '.join(scale)))
+
+        self.stdout.write('\nLoaded %d rounds in %.3fs, analysed them in %.3fs' %
+                          (len(rounds.player), loaded - start, computed - loaded))
@@ -0,0 +1,57 @@
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from game import archive
+
+def parse_moment(value):
+    """Parse a date or datetime given on the command line, in the current time
+    zone unless stated otherwise."""
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise CommandError('Not a date: %s' % value)
+        moment = datetime(date.year, date.month, date.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.get_current_timezone())
+    return moment
+
+class Command(BaseCommand):
+    args = '<name>'
+    help = ('Moves the players of a completed wave (by default those that finished '
+            'the game), with their rounds and answers, to the archive with the given '
+            'name (see game.archive). Exports and analyses keep reading archived '
+            'players. Without a name, lists the archives.')
+    option_list = BaseCommand.option_list + (
+        make_option('--since', default=None,
+                    help='Only archive players that registered at or after this date '
+                         '(YYYY-MM-DD or YYYY-MM-DD HH:MM).'),
+        make_option('--until', default=None,
+                    help='Only archive players that registered before this date.'),
+        make_option('--state', choices=[archive.FINISHED, archive.UNFINISHED, archive.ALL],
+                    default=archive.FINISHED,
+                    help='The players to archive: finished (default), unfinished or all.'),
+        make_option('--chunk-size', type='int', default=archive.CHUNK_SIZE,
+                    help='The number of players to move per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        if not args:
+            for name in archive.list_archives():
+                self.stdout.write(archive.get_path(name))
+            return
+        if len(args) > 1:
+            raise CommandError('Give a single archive name.')
+
+        since = parse_moment(options['since']) if options['since'] else None
+        until = parse_moment(options['until']) if options['until'] else None
+        try:
+            moved = archive.archive_wave(args[0], since, until, options['state'],
+                                         options['chunk_size'])
+        except archive.ArchiveError as e:
+            raise CommandError(str(e))
+        self.stdout.write('Moved %d players to %s' % (moved, archive.get_path(args[0])))
@@ -0,0 +1,65 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game import benchmark
+from game.models import Player
+
+class Command(BaseCommand):
+    help = ('Lets simulated participants play the whole game and fails if a view '
+            'runs more queries, or takes longer, than its budget. Use --populate '
+            'first to benchmark against a realistically sized database. The '
+            'participants are stored in the configured database, so only run this '
+            'against a stand-in database; the query counts alone are also checked '
+            'by the tests (python manage.py test game).')
+    option_list = BaseCommand.option_list + (
+        make_option('--populate', type='int', default=0, metavar='PLAYERS',
+                    help='First add this many finished players, with their rounds '
+                         'and answers, to the database (e.g. 10000).'),
+        make_option('-n', '--participants', type='int', default=20,
+                    help='The number of participants to measure (default: 20).'),
+        make_option('--budgets', default=benchmark.BUDGETS_FILE,
+                    help='The budgets file (default: benchmarks/view_budgets.json '
+                         'next to manage.py).'),
+        make_option('--update', action='store_true', default=False,
+                    help='Record the measurements as the new budgets.'),
+        make_option('--noinput', action='store_false', dest='interactive', default=True,
+                    help='Do not ask for confirmation.'),
+    )
+
+    def handle(self, *args, **options):
+        players = Player.objects.count()
+        if options['populate'] and players:
+            # Populating also resets the allocation and dashboard counters.
+            raise CommandError('--populate only fills an empty stand-in database, and '
+                               'this one holds %d players.' % players)
+        if options['interactive']:
+            confirm = raw_input('This stores %d simulated participants%s in the configured '
+                                'database. Type \'yes\' to continue: ' %
+                                (options['participants'],
+                                 ' and %d finished players' % options['populate']
+                                 if options['populate'] else ''))
+            if confirm != 'yes':
+                raise CommandError('Benchmark cancelled.')
+
+        if options['populate']:
+            self.stdout.write('Adding %d players...' % options['populate'])
+            benchmark.populate(options['populate'])
+
+        results = benchmark.run(options['participants'])
+
+        self.stdout.write('%-20s %-6s %8s %8s %8s' %
+                          ('view', 'method', 'p50 ms', 'p95 ms', 'queries'))
+        for r in results:
+            self.stdout.write('%-20s %-6s %8.1f %8.1f %8d' %
+                              (r['view'], r['method'], r['p50'], r['p95'], r['max_queries']))
+
+        if options['update']:
+            benchmark.write_budgets(options['budgets'], results)
+            self.stdout.write('Updated %s' % options['budgets'])
+            return
+
+        failures = benchmark.check(results, benchmark.read_budgets(options['budgets']))
+        if failures:
+            raise CommandError('Over budget:\n' + '\n'.join(failures))
+        self.stdout.write('All views are within budget')
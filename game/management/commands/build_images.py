@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game import images
+
+class Command(BaseCommand):
+    help = ('Builds resized and recompressed variants of the opponent pictures '
+            'and instruction images, with content-hashed names, along with a '
+            'manifest of them (see game.images). Requires PIL.')
+
+    def handle(self, *args, **options):
+        try:
+            import PIL
+        except ImportError as e:
+            raise CommandError('Building images requires PIL: %s' % e)
+
+        manifest = images.build()
+        count = sum(len(variants) for variants in manifest.values())
+        self.stdout.write('Built %d variants of %d images' % (count, len(manifest)))
@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from game import answers
+
+class Command(BaseCommand):
+    help = ('Moves the answers stored as one Answer row per question into one '
+            'AnswerSheet per player (see game.answers). Set GAME_ANSWER_STORAGE '
+            'to \'sheets\' first, so that new answers are stored as sheets too.')
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=500,
+                    help='The number of players to convert per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        if answers.get_storage() != 'sheets':
+            self.stderr.write('Note: GAME_ANSWER_STORAGE is not \'sheets\', so new '
+                              'answers are still stored as rows.')
+        converted, skipped = answers.convert_rows(options['chunk_size'])
+        self.stdout.write('Converted the answers of %d players' % converted)
+        if skipped:
+            self.stdout.write('Kept the rows of %d players whose answers are not all in '
+                              'the current questionnaire: %s' %
+                              (len(skipped), ', '.join(str(p) for p in skipped)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game import replica
+
+class Command(BaseCommand):
+    help = ('Replaces the replica database with a copy of the default one. Stands in '
+            'for replication when both are SQLite databases (see game.replica).')
+
+    def handle(self, *args, **options):
+        try:
+            replica.copy_replica()
+        except replica.ReplicaError as e:
+            raise CommandError(str(e))
+        self.stdout.write('Copied the default database to %r' % replica.REPLICA)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game import benchmark
+
+class Command(BaseCommand):
+    help = ('Shows how the database executes the queries the game and the export '
+            'run most, and fails if any of them is not served by an index. '
+            'Supports MySQL and SQLite.')
+
+    def handle(self, *args, **options):
+        try:
+            results = benchmark.explain_hot_queries()
+        except NotImplementedError as e:
+            raise CommandError(str(e))
+
+        failures = []
+        for description, plan, uses_index in results:
+            self.stdout.write('%s%s' % (description, '' if uses_index else ' (NO INDEX)'))
+            for line in plan:
+                self.stdout.write('    %s' % line)
+            if not uses_index:
+                failures.append(description)
+
+        if failures:
+            raise CommandError('Not served by an index: %s' % ', '.join(failures))
+        self.stdout.write('All hot queries are served by an index')
@@ -0,0 +1,43 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game import columnar, export
+from game.replica import replica_reads
+
+class Command(BaseCommand):
+    help = ('Exports the rounds of all players that finished the game to a CSV file. '
+            'With --incremental, only the rounds of players that finished since '
+            'the previous export to the same file are appended. With '
+            '--format=columns, the rounds are written to a directory of binary '
+            'column files instead (see game.columnar).')
+    option_list = BaseCommand.option_list + (
+        make_option('-o', '--output', default=None,
+                    help='The file (or directory) to write to (default: output.csv, '
+                         'or output for columns).'),
+        make_option('--format', choices=['csv', 'columns'], default='csv',
+                    help='The format to export to: csv (default) or columns.'),
+        make_option('--incremental', action='store_true', default=False,
+                    help='Append newly finished players instead of rebuilding the file.'),
+        make_option('--chunk-size', type='int', default=export.CHUNK_SIZE,
+                    help='The number of rounds to read per query.'),
+    )
+
+    def handle(self, *args, **options):
+        with replica_reads():
+            self.export(options)
+
+    def export(self, options):
+        if options['format'] == 'columns':
+            if options['incremental']:
+                raise CommandError('Columns can only be exported in full.')
+            output = options['output'] or 'output'
+            count = columnar.export_columns(output, chunk_size=options['chunk_size'])
+        else:
+            output = options['output'] or 'output.csv'
+            try:
+                count = export.export_file(output, options['incremental'],
+                                           options['chunk_size'])
+            except export.ExportError as e:
+                raise CommandError(str(e))
+        self.stdout.write('Exported %d rounds to %s' % (count, output))
@@ -0,0 +1,31 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game import questionnaire_spec
+
+class Command(BaseCommand):
+    args = '[spec.json]'
+    help = ('Brings the questions and options in the database in line with a '
+            'questionnaire spec (default: questionnaire.json), leaving existing '
+            'answers alone. See game.questionnaire_spec.')
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', default=False,
+                    help='Only show what would change.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError('Give at most one spec.')
+        path = args[0] if args else 'questionnaire.json'
+        try:
+            spec = questionnaire_spec.read_spec(path)
+            changes = questionnaire_spec.load(spec, options['dry_run'])
+        except (IOError, ValueError, questionnaire_spec.SpecError) as e:
+            raise CommandError('Cannot load %s: %s' % (path, e))
+        if not changes:
+            self.stdout.write('The questionnaire is up to date')
+        elif options['dry_run']:
+            self.stdout.write('Would have: %s' % changes.describe())
+        else:
+            self.stdout.write('Loaded %s: %s' % (path, changes.describe()))
@@ -0,0 +1,67 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game import loadtest, persistent
+
+class Command(BaseCommand):
+    help = ('Lets simulated participants play the whole game concurrently and '
+            'reports the throughput, and the latency and query count per view. '
+            'The participants are stored in the configured database, so only '
+            'run this against a stand-in database.')
+    option_list = BaseCommand.option_list + (
+        make_option('-n', '--participants', type='int', default=50,
+                    help='The number of participants (default: 50).'),
+        make_option('-c', '--concurrency', type='int', default=10,
+                    help='The number of participants playing at the same time (default: 10).'),
+        make_option('--think-time', type='float', default=0.0,
+                    help='The mean time (in seconds) a participant waits before '
+                         'submitting a page (default: 0).'),
+        make_option('--compare-connections', action='store_true', default=False,
+                    help='Run the load test twice, closing the database connections '
+                         'after every request and keeping them open (see '
+                         'game.persistent), and compare the throughput.'),
+        make_option('--noinput', action='store_false', dest='interactive', default=True,
+                    help='Do not ask for confirmation.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['interactive']:
+            confirm = raw_input('This stores %d simulated participants in the configured '
+                                'database. Type \'yes\' to continue: ' % options['participants'])
+            if confirm != 'yes':
+                raise CommandError('Load test cancelled.')
+
+        if options['compare_connections']:
+            self.compare_connections(options)
+            return
+
+        samples, errors, elapsed = loadtest.run(options['participants'],
+                                                options['concurrency'],
+                                                options['think_time'])
+
+        self.stdout.write('%d participants, %d requests in %.1fs: %.1f requests/s, %d errors' %
+                          (options['participants'], len(samples), elapsed,
+                           len(samples) / elapsed, len(errors)))
+        for e in errors[:10]:
+            self.stderr.write('Error: %s' % e)
+        self.stdout.write('%-20s %-6s %8s %8s %8s %8s %8s %8s' %
+                          ('view', 'method', 'requests', 'p50 ms', 'p95 ms', 'p99 ms',
+                           'queries', 'max'))
+        for r in loadtest.summarize(samples):
+            self.stdout.write('%-20s %-6s %8d %8.1f %8.1f %8.1f %8.1f %8d' %
+                              (r['view'], r['method'], r['requests'], r['p50'],
+                               r['p95'], r['p99'], r['queries'], r['max_queries']))
+
+    def compare_connections(self, options):
+        runs = loadtest.compare_connections(options['participants'], options['concurrency'],
+                                            options['think_time'],
+                                            persistent.MAX_AGE or None)
+        rates = []
+        for label, opened, samples, errors, elapsed in runs:
+            rates.append(len(samples) / elapsed)
+            self.stdout.write('%-10s %d requests in %.1fs: %.1f requests/s, '
+                              '%d connections opened, %d errors' %
+                              (label, len(samples), elapsed, rates[-1], opened, len(errors)))
+        self.stdout.write('Keeping connections open: %.2fx the requests per second' %
+                          (rates[1] / rates[0]))
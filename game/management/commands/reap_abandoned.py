@@ -0,0 +1,43 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from game import reaper
+
+class Command(BaseCommand):
+    help = ('Deletes the players that registered more than --max-age hours ago '
+            'without playing a round (or, with --include-partial, without '
+            'finishing the game), as well as expired sessions, in small batches. '
+            'Safe to run while a study is running, e.g. from cron.')
+    option_list = BaseCommand.option_list + (
+        make_option('--max-age', type='float',
+                    default=reaper.DEFAULT_MAX_AGE.total_seconds() / 3600,
+                    help='The age (in hours) after which an unfinished player is '
+                         'considered abandoned (default: %default).'),
+        make_option('--include-partial', action='store_true', default=False,
+                    help='Also delete players that played some rounds, along with '
+                         'their rounds and answers.'),
+        make_option('--batch-size', type='int', default=reaper.BATCH_SIZE,
+                    help='The number of rows to delete per transaction.'),
+        make_option('--pause', type='float', default=0.1,
+                    help='The number of seconds to wait between batches.'),
+        make_option('--dry-run', action='store_true', default=False,
+                    help='Only count the abandoned players.'),
+    )
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['max_age'])
+        if options['dry_run']:
+            count = reaper.abandoned_players(max_age, options['include_partial']).count()
+            self.stdout.write('%d abandoned players' % count)
+            return
+
+        deleted = reaper.reap_players(max_age, options['include_partial'],
+                                      options['batch_size'], options['pause'])
+        per_kind = ', '.join('%s: %d' % item for item in sorted(deleted.items()))
+        self.stdout.write('Deleted %d abandoned players%s' % (
+            sum(deleted.values()), ' (%s)' % per_kind if per_kind else ''))
+        sessions = reaper.reap_sessions(options['batch_size'], options['pause'])
+        if sessions is not None:
+            self.stdout.write('Deleted %d expired sessions' % sessions)
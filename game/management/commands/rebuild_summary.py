@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from game import summary
+
+class Command(BaseCommand):
+    help = 'Recomputes the counters shown on the dashboard from the players and rounds.'
+
+    def handle(self, *args, **options):
+        summary.rebuild()
+        self.stdout.write('Rebuilt the dashboard counters')
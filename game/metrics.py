@@ -0,0 +1,196 @@
+"""Per-request instrumentation.
+
+MetricsMiddleware measures, per view, the wall time of requests, the number
+and time of their SQL queries, the size of the session they read and wrote and
+the time spent rendering templates. The measurements go into histograms kept in
+the process, which the metrics view exposes in the Prometheus text format and
+which are summarized in a log line (on the game.metrics logger) every
+GAME_METRICS_LOG_INTERVAL seconds.
+
+Only a fraction of the requests, GAME_METRICS_SAMPLE_RATE, is measured; the
+other requests cost a single random number. Note that every process keeps its
+own histograms, so with several server processes a scrape sees just one.
+"""
+import bisect
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = getattr(settings, 'GAME_METRICS_SAMPLE_RATE', 1.0)
+LOG_INTERVAL = getattr(settings, 'GAME_METRICS_LOG_INTERVAL', 60)
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+BYTE_BUCKETS = (0, 64, 128, 256, 512, 1024, 2048, 4096)
+
+# The histograms: (name, help text, buckets).
+METRICS = [
+    ('game_request_seconds', 'Wall time of requests.', TIME_BUCKETS),
+    ('game_sql_queries', 'SQL queries per request.', COUNT_BUCKETS),
+    ('game_sql_seconds', 'Time spent in SQL queries per request.', TIME_BUCKETS),
+    ('game_session_read_bytes', 'Size of the session read per request.', BYTE_BUCKETS),
+    ('game_session_write_bytes', 'Size of the session written per request.', BYTE_BUCKETS),
+    ('game_template_seconds', 'Time spent rendering templates per request.', TIME_BUCKETS),
+]
+
+class Histogram(object):
+    """A cumulative histogram, as in Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # counts[i]: the number of observations in (buckets[i - 1], buckets[i]];
+        # the last one counts those above all buckets.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the q-th quantile."""
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return '+Inf'
+
+_lock = threading.Lock()
+# Per metric name, the histogram of each view.
+_histograms = dict((name, {}) for name, _, _ in METRICS)
+_buckets = dict((name, buckets) for name, _, buckets in METRICS)
+_last_log = [time.time()]
+
+def observe(view, values):
+    """Record the given measurements (by metric name) of a request to view."""
+    with _lock:
+        for name, value in values.items():
+            histograms = _histograms[name]
+            if view not in histograms:
+                histograms[view] = Histogram(_buckets[name])
+            histograms[view].observe(value)
+
+def format_bound(bound):
+    return bound if isinstance(bound, str) else repr(float(bound))
+
+def render_prometheus():
+    """Return all histograms in the Prometheus text format."""
+    lines = []
+    with _lock:
+        for name, help, _ in METRICS:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s histogram' % name)
+            for view, histogram in sorted(_histograms[name].items()):
+                for bound, total in histogram.cumulative():
+                    lines.append('%s_bucket{view="%s",le="%s"} %d' %
+                                 (name, view, format_bound(bound), total))
+                lines.append('%s_sum{view="%s"} %s' % (name, view, repr(float(histogram.sum))))
+                lines.append('%s_count{view="%s"} %d' % (name, view, histogram.count))
+    return '\n'.join(lines) + '\n'
+
+def summary_line():
+    """Return a one-line summary of the requests measured so far: per view,
+    the number of requests, the 95th percentile time and the mean number of
+    queries."""
+    with _lock:
+        parts = []
+        for view, histogram in sorted(_histograms['game_request_seconds'].items()):
+            queries = _histograms['game_sql_queries'][view]
+            parts.append('%s n=%d p95<=%ss queries=%.1f' %
+                         (view, histogram.count, histogram.quantile(0.95),
+                          float(queries.sum) / max(queries.count, 1)))
+    return '; '.join(parts) or 'no requests'
+
+def maybe_log():
+    now = time.time()
+    with _lock:
+        if now - _last_log[0] < LOG_INTERVAL:
+            return
+        _last_log[0] = now
+    logger.info('Requests (sampled at %s): %s', SAMPLE_RATE, summary_line())
+
+# Template render time is accumulated per thread, for the outermost template
+# being rendered only (as included templates are rendered within it).
+_render = threading.local()
+_original_render = Template._render
+
+def _timed_render(self, context):
+    if getattr(_render, 'depth', None) is None:
+        # Not measuring this request.
+        return _original_render(self, context)
+    _render.depth += 1
+    start = time.time()
+    try:
+        return _original_render(self, context)
+    finally:
+        _render.depth -= 1
+        if _render.depth == 0:
+            _render.elapsed += time.time() - start
+
+Template._render = _timed_render
+
+def session_bytes(request, response):
+    """Return the size of the session read and written by a request."""
+    session = getattr(request, 'session', None)
+    if session is None:
+        return 0, 0
+    if settings.SESSION_ENGINE.endswith('signed_cookies'):
+        # The session is the cookie.
+        name = settings.SESSION_COOKIE_NAME
+        read = len(request.COOKIES.get(name, ''))
+        written = len(response.cookies[name].value) if name in response.cookies else 0
+        return read, written
+    if not session.accessed:
+        return 0, 0
+    size = len(session.encode(dict(session.items())))
+    return size, size if session.modified else 0
+
+class MetricsMiddleware(object):
+    def process_request(self, request):
+        if random.random() >= SAMPLE_RATE:
+            return None
+        request._metrics = (time.time(), connection.use_debug_cursor)
+        # Record the queries, even if not DEBUG.
+        connection.use_debug_cursor = True
+        _render.depth = 0
+        _render.elapsed = 0.0
+        return None
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_metrics'):
+            return response
+        start, use_debug_cursor = request._metrics
+        elapsed = time.time() - start
+        connection.use_debug_cursor = use_debug_cursor
+        queries = connection.queries
+        render_elapsed = _render.elapsed
+        _render.depth = None
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name if match else None) or 'other'
+        read, written = session_bytes(request, response)
+        observe(view, {
+            'game_request_seconds': elapsed,
+            'game_sql_queries': len(queries),
+            'game_sql_seconds': sum(float(q['time']) for q in queries),
+            'game_session_read_bytes': read,
+            'game_session_write_bytes': written,
+            'game_template_seconds': render_elapsed,
+        })
+        maybe_log()
+        return response
@@ -1,3 +1,4 @@
+import json
 import logging
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -27,13 +28,34 @@ class Kind(models.Model):
     def __unicode__(self):
         return self.get_id_display()
 
+class KindCounter(models.Model):
+    """Number of players that have been assigned to an opponent kind.
+
+    Maintained by game.allocation, so that assigning a new player to the least
+    used kind never has to count the Player table.
+    """
+    kind = models.OneToOneField(Kind, primary_key=True)
+    num_players = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return '<KC(%s) %s>' % (self.kind_id, self.num_players)
+
+class SummaryCounter(models.Model):
+    """A named count of events, maintained by game.summary for the dashboard."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return '<SC(%s) %s>' % (self.name, self.value)
+
 class Opponent(models.Model):
     # XXX: Beter way of storing this?
     kind = models.ForeignKey(Kind)
     picture = models.CharField(max_length=20)
 
     def __unicode__(self):
-        return '<O(%s) %s>' % (self.kind, self.pk)
+        # The kind's name follows from its id; don't fetch it.
+        return '<O(%s) %s>' % (Kind(id=self.kind_id), self.pk)
 
 class Player(models.Model):
     MALE = False
@@ -45,10 +67,12 @@ class Player(models.Model):
     
     YES_NO = ((True, 'Yes'), (False, 'No'))
 
-    registration_datetime = models.DateTimeField(auto_now_add=True)
+    registration_datetime = models.DateTimeField(auto_now_add=True, db_index=True)
     opponent_kind = models.ForeignKey(Kind)
     #opponents = models.ManyToManyField(Opponent)
     mturk_key = models.CharField(max_length=32, default=0, editable=False)
+    # When the player received its mturk_key, i.e. finished the game.
+    finished_datetime = models.DateTimeField(null=True, editable=False, db_index=True)
     start_time = models.IntegerField(default=-1)
     instructions_time = models.IntegerField(default=-1)
     questionnaire_time = models.IntegerField(default=-1)
@@ -60,15 +84,34 @@ class Player(models.Model):
     age = models.CharField(max_length=3)
     nationality = models.CharField(max_length=50)
 
+    # The number of rounds played, maintained by record_round() so that the
+    # game views never have to count the player's rounds.
+    rounds_played = models.IntegerField(default=0, editable=False)
+    # The opponents, offers and intents of all rounds, drawn up at
+    # registration; see game.schedules.
+    schedule = models.CharField(max_length=100, blank=True, editable=False)
+
     # XXX: Express that all opponents should be of the same kind.
 
     def __unicode__(self):
-        return '<P(%s) %s>' % (self.opponent_kind, self.pk)
+        return '<P(%s) %s>' % (Kind(id=self.opponent_kind_id), self.pk)
+
+    def record_round(self, round):
+        """Count a round that was just saved.
+
+        Must be called within the transaction that saved the round. The player
+        row is locked for the update, so concurrent requests of the same
+        participant cannot lose an update.
+        """
+        player = Player.objects.select_for_update().get(pk=self.pk)
+        player.rounds_played += 1
+        player.save(update_fields=['rounds_played'])
+        self.rounds_played = player.rounds_played
 
 class Round(models.Model):
     ACCEPT_CHOICES = ((True, 'Accept'), (False, 'Reject'))
 
-    datetime = models.DateTimeField(auto_now=True)
+    datetime = models.DateTimeField(auto_now=True, db_index=True)
     player = models.ForeignKey(Player)
     opponent = models.ForeignKey(Opponent)
     amount_offered = models.IntegerField()
@@ -77,6 +120,15 @@ class Round(models.Model):
     time_elapsed = models.IntegerField(default=-1)
 
     # XXX: Express that oppenent's kind matches player's selected opponent_kind.
+
+    class Meta:
+        # A player plays each opponent only once. The unique index also serves
+        # lookups of all rounds of a player.
+        unique_together = (('player', 'opponent'),)
+        # The second index covers the filters of the admin's list of rounds,
+        # so counting the rounds that pass them does not read the table.
+        index_together = [['player', 'is_intentional'],
+                          ['amount_offered', 'is_intentional', 'accepted']]
     
     def clean(self):
         if self.accepted not in (True, False):
@@ -107,6 +159,9 @@ class Answer(models.Model):
     #options = [o for o in Option.objects.all() if o.question==Question.objects.all()[2]]
     #choices = ((option.id, option.text) for option in options) 
     option = models.ForeignKey(Option)      
+
+    class Meta:
+        unique_together = (('player', 'question'),)
     
     def __unicode__(self):
         return '<A %s / %s / %s>' % (self.player, self.question, self.option)
@@ -116,3 +171,30 @@ class Answer(models.Model):
         options = [o for o in Option.objects.all() if o.question==question]
         choices = ((option.id, option.text) for option in options)
         return choices
+
+class QuestionnaireVersion(models.Model):
+    """A layout of the questionnaire, as used by AnswerSheets: the ids of the
+    questions and, per question, of its options, in order."""
+    # A hash of the layout (see Questionnaire.layout_id).
+    id = models.CharField(max_length=12, primary_key=True)
+    layout = models.TextField(editable=False)
+    created_datetime = models.DateTimeField(auto_now_add=True)
+
+    def get_layout(self):
+        return tuple((q, tuple(o)) for q, o in json.loads(self.layout))
+
+    def __unicode__(self):
+        return '<QV %s>' % self.id
+
+class AnswerSheet(models.Model):
+    """All answers of a player to the questionnaire, in a single row (see
+    game.answers for the encoding)."""
+    player = models.OneToOneField(Player, primary_key=True)
+    version = models.ForeignKey(QuestionnaireVersion)
+    answers = models.CharField(max_length=255)
+
+    def __unicode__(self):
+        return '<AS %s / %s / %s>' % (self.player_id, self.version_id, self.answers)
+
+# Connect the signal handlers that keep the questionnaire cache up to date.
+import game.questionnaire
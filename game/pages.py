@@ -0,0 +1,52 @@
+"""Cached rendering of the pages that hardly depend on the request.
+
+Some pages (the start page, the instructions, the intentionality pages) only
+depend on a variant, such as the player's opponent kind. render_cached()
+renders each variant once and keeps it in Django's cache, so further requests
+skip template rendering altogether. Every such page gets an ETag, so a browser
+that already has the page gets an empty 304 Not Modified response instead.
+
+A page may contain {% csrf_token %}: it is rendered with a placeholder, which
+is replaced by the requesting user's token. The views themselves still run on
+every request, so whatever they record (timings, counters) is unaffected.
+
+With DEBUG on, pages are rendered every time, so template changes show at once.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.http import parse_etags, quote_etag
+
+# How long rendered pages are kept, in seconds. After a change to a template,
+# the old page can be served for this long (unless the cache is cleared).
+PAGE_TIMEOUT = 10 * 60
+
+CSRF_PLACEHOLDER = '__csrf_token__'
+
+def render_page(template_name, context):
+    return render_to_string(template_name, dict(context, csrf_token=CSRF_PLACEHOLDER))
+
+def render_cached(request, template_name, variant='', context=None):
+    """Return the response of a page that, apart from its CSRF token, only
+    depends on the given template and variant; context holds the values the
+    template needs to render the variant."""
+    key = 'game:page:%s:%s' % (template_name, variant)
+    page = None if settings.DEBUG else cache.get(key)
+    if page is None:
+        page = render_page(template_name, context or {})
+        if not settings.DEBUG:
+            cache.set(key, page, PAGE_TIMEOUT)
+
+    if CSRF_PLACEHOLDER in page:
+        page = page.replace(CSRF_PLACEHOLDER, get_token(request))
+    etag = hashlib.md5(page.encode('utf-8')).hexdigest()
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(page)
+    response['ETag'] = quote_etag(etag)
+    return response
@@ -0,0 +1,84 @@
+"""Database connections that are kept open between requests.
+
+Django 1.5 closes every database connection at the end of every request, so
+each request opens a new one; for short views such as start_round and
+end_round, connecting (and, for MySQL, authenticating and setting up the
+session) is a large part of the time taken. PersistentConnectionMiddleware
+replaces Django's handler for the end of a request by finish_request(), which
+keeps the connections of the thread open for the next request, for up to
+GAME_DB_CONN_MAX_AGE seconds (None: for good; 0: close them, as Django does).
+
+A connection that is kept is cleaned up as Django would before closing it: any
+transaction is rolled back, including the one MySQL opens for reads, so the next
+request doesn't see an outdated snapshot. A connection is closed regardless
+after a request that raised an exception, or if rolling back fails. The MySQL
+backend pings its connection before every use, and reconnects if the server
+closed it (e.g. after wait_timeout).
+
+Every thread of every server process keeps its own connections, so make sure
+the database allows enough of them (max_connections).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, close_connection, connections, transaction
+from django.db.backends.signals import connection_created
+
+MAX_AGE = getattr(settings, 'GAME_DB_CONN_MAX_AGE', 0)
+
+_state = threading.local()
+
+def record_created(sender, connection, **kwargs):
+    connection.game_created = time.time()
+
+def record_exception(**kwargs):
+    _state.failed = True
+
+def is_obsolete(connection):
+    if MAX_AGE is None:
+        return False
+    return time.time() - getattr(connection, 'game_created', 0) >= MAX_AGE
+
+def finish_request(**kwargs):
+    """Clean up the connections of this thread at the end of a request, and
+    close those that should not be reused."""
+    failed = getattr(_state, 'failed', False)
+    _state.failed = False
+    for alias in connections:
+        connection = connections[alias]
+        if connection.is_managed():
+            # A transaction that outlives the request, such as a TestCase's:
+            # not ours to end.
+            continue
+        # As django.db.close_connection.
+        transaction.abort(alias)
+        if connection.connection is None:
+            continue
+        if failed or is_obsolete(connection):
+            connection.close()
+            continue
+        try:
+            connection._rollback()
+        except DatabaseError:
+            connection.close()
+
+_installed = []
+
+def install():
+    """Replace Django's handler for the end of a request by finish_request()."""
+    if _installed:
+        return
+    _installed.append(True)
+    connection_created.connect(record_created)
+    signals.got_request_exception.connect(record_exception)
+    signals.request_finished.disconnect(close_connection)
+    signals.request_finished.connect(finish_request)
+
+class PersistentConnectionMiddleware(object):
+    def __init__(self):
+        if MAX_AGE == 0:
+            raise MiddlewareNotUsed
+        install()
@@ -0,0 +1,107 @@
+"""In-process cache of the questionnaire's structure.
+
+The questions and their options hardly ever change, so they are loaded once per
+process into immutable tuples and paginated up front. Saving or deleting a
+Question or Option (e.g. through QuestionAdmin) replaces the version token in
+Django's cache, which makes every process reload the questionnaire on its next
+request. The token is only replaced once the change is committed: at the end of
+the request that made it, or by game.questionnaire_spec.load() (otherwise,
+another process could cache the old questionnaire under the new token).
+
+With a shared CACHES backend (e.g. memcached) every process reloads right away.
+With the default local-memory cache, a change only reaches the process that
+made it (and not at all when made by a command such as load_questionnaire);
+the other processes reload when their token expires, VERSION_TIMEOUT seconds
+after they last did.
+"""
+import hashlib
+import json
+import threading
+from collections import namedtuple
+from uuid import uuid4
+
+from django.core import signals
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from game.models import Option, Question
+
+# The number of questions per page in the questionnaire.
+QUESTIONS_PER_PAGE = 5
+# The minimum number of questions per page in the questionnaire.
+QUESTION_ORPHANS = 2
+
+VERSION_KEY = 'game:questionnaire:version'
+# How long (in seconds) a version token lasts, and thereby how long a process
+# may keep an outdated questionnaire without a shared cache.
+VERSION_TIMEOUT = 60
+
+# A question, along with its options as (id, text) pairs.
+CachedQuestion = namedtuple('CachedQuestion', ['id', 'text', 'options'])
+
+class Questionnaire(object):
+    def __init__(self, version, questions):
+        self.version = version
+        self.questions = tuple(questions)
+        self.paginator = Paginator(self.questions, per_page=QUESTIONS_PER_PAGE,
+                                   orphans=QUESTION_ORPHANS)
+        self.pages = tuple(self.paginator.page(n) for n in self.paginator.page_range)
+        # The ids of the questions and their options, in order, and a hash of
+        # them that identifies this layout (see game.answers).
+        self.layout = tuple((q.id, tuple(o[0] for o in q.options)) for q in self.questions)
+        self.layout_id = hashlib.md5(json.dumps(self.layout)).hexdigest()[:12]
+
+    @property
+    def num_pages(self):
+        return len(self.pages)
+
+    def page(self, number):
+        return self.pages[number - 1]
+
+def load_questionnaire(version):
+    options = {}
+    for o in Option.objects.order_by('id').values_list('id', 'question', 'text'):
+        options.setdefault(o[1], []).append((o[0], o[2]))
+    questions = [CachedQuestion(q.id, q.text, tuple(options.get(q.id, ())))
+                 for q in Question.objects.order_by('id')]
+    return Questionnaire(version, questions)
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Never set, expired or evicted. Either way, everyone must reload.
+        cache.add(VERSION_KEY, uuid4().hex, VERSION_TIMEOUT)
+        version = cache.get(VERSION_KEY)
+    return version
+
+_questionnaire = None
+
+def get_questionnaire():
+    global _questionnaire
+    version = get_version()
+    if _questionnaire is None or _questionnaire.version != version:
+        _questionnaire = load_questionnaire(version)
+    return _questionnaire
+
+_state = threading.local()
+
+def invalidate_questionnaire():
+    """Make every process reload the questionnaire. Only call this once the
+    changes are committed."""
+    _state.changed = False
+    cache.set(VERSION_KEY, uuid4().hex, VERSION_TIMEOUT)
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+def questionnaire_changed(**kwargs):
+    # Still within the transaction that made the change.
+    _state.changed = True
+
+@receiver(signals.request_finished)
+def invalidate_if_changed(**kwargs):
+    if getattr(_state, 'changed', False):
+        invalidate_questionnaire()
@@ -0,0 +1,171 @@
+"""Loading the questionnaire from a declarative spec.
+
+The spec is a JSON list of the questions, in order, each with its text and the
+texts of its options, in order:
+
+    [{"text": "Please indicate your gender.", "options": ["Male", "Female"]}, ...]
+
+diff() compares a spec with the questions and options in the database, and
+apply() makes only the changes needed, with a handful of (bulk) queries in a
+single transaction. Questions and options are matched by their text, so loading
+the same spec again changes nothing. To correct the text of a question, give
+it the id of the question in the database ("id": 12) to match it by instead.
+
+Answers are never deleted: a spec that leaves out a question or option that has
+been answered (or that is part of the layout of an AnswerSheet) is refused. As the questionnaire is shown in the order in which
+questions and options were created, new questions and options can only be added
+after the existing ones.
+"""
+import json
+
+from django.db import transaction
+from django.db.models import Max, Q
+
+from game.models import Answer, Option, Question, QuestionnaireVersion
+from game.questionnaire import invalidate_questionnaire
+
+# The number of options inserted per query.
+BATCH_SIZE = 500
+
+class SpecError(Exception):
+    pass
+
+def read_spec(path):
+    """Read and check the spec in the given file."""
+    with open(path) as f:
+        spec = json.load(f)
+    if not isinstance(spec, list):
+        raise SpecError('The spec must be a list of questions.')
+    for i, question in enumerate(spec):
+        if not isinstance(question, dict) or not question.get('text') or not question.get('options'):
+            raise SpecError('Question %d must have a text and options.' % (i + 1))
+        if len(set(question['options'])) != len(question['options']):
+            raise SpecError('Question %d has the same option more than once.' % (i + 1))
+    return spec
+
+class Changes(object):
+    """The changes that bring the database in line with a spec."""
+
+    def __init__(self):
+        self.new_questions = []
+        self.new_options = []
+        # (question id, new text) pairs.
+        self.renamed_questions = []
+        self.deleted_questions = []
+        self.deleted_options = []
+
+    def __nonzero__(self):
+        return any([self.new_questions, self.new_options, self.renamed_questions,
+                    self.deleted_questions, self.deleted_options])
+
+    def describe(self):
+        return ('%d questions and %d options added, %d questions changed, '
+                '%d questions and %d options deleted' %
+                (len(self.new_questions), len(self.new_options),
+                 len(self.renamed_questions), len(self.deleted_questions),
+                 len(self.deleted_options)))
+
+def take_match(candidates, value, field=1):
+    """Remove and return the first of the given (id, text) pairs with the given
+    text (or with field=0, id), if any."""
+    for i, candidate in enumerate(candidates):
+        if candidate[field] == value:
+            return candidates.pop(i)
+    return None
+
+def diff(spec):
+    """Return the Changes that bring the database in line with the given spec."""
+    changes = Changes()
+    questions = list(Question.objects.order_by('id').values_list('id', 'text'))
+    options = {}
+    for o in Option.objects.order_by('id').values_list('id', 'question', 'text'):
+        options.setdefault(o[1], []).append((o[0], o[2]))
+    next_question_id = (Question.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    next_option_id = (Option.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+    question_ids = []
+    for i, spec_question in enumerate(spec):
+        if 'id' in spec_question:
+            match = take_match(questions, spec_question['id'], field=0)
+            if match is None:
+                raise SpecError('Question %d refers to question id %s, which does not exist '
+                                'or is used twice.' % (i + 1, spec_question['id']))
+            if match[1] != spec_question['text']:
+                changes.renamed_questions.append((match[0], spec_question['text']))
+        else:
+            match = take_match(questions, spec_question['text'])
+
+        if match is None:
+            question_id = next_question_id
+            next_question_id += 1
+            changes.new_questions.append(Question(id=question_id, text=spec_question['text']))
+        else:
+            question_id = match[0]
+        question_ids.append(question_id)
+
+        existing = options.pop(question_id, [])
+        option_ids = []
+        for text in spec_question['options']:
+            option = take_match(existing, text)
+            if option is None:
+                option_ids.append(next_option_id)
+                changes.new_options.append(Option(id=next_option_id, question_id=question_id,
+                                                  text=text))
+                next_option_id += 1
+            else:
+                option_ids.append(option[0])
+        changes.deleted_options.extend(o[0] for o in existing)
+        if option_ids != sorted(option_ids):
+            raise SpecError('The options of question %d cannot be reordered, and new '
+                            'options can only be added after the existing ones.' % (i + 1))
+
+    if question_ids != sorted(question_ids):
+        raise SpecError('Questions cannot be reordered, and new questions can only be '
+                        'added after the existing ones.')
+    changes.deleted_questions = [q[0] for q in questions]
+    for q in changes.deleted_questions:
+        changes.deleted_options.extend(o[0] for o in options.pop(q, []))
+
+    if (changes.deleted_questions or changes.deleted_options) and is_answered(
+            changes.deleted_questions, changes.deleted_options):
+        raise SpecError('The spec leaves out questions or options that have been answered.')
+    return changes
+
+def is_answered(question_ids, option_ids):
+    """Return whether any of the given questions or options may have been
+    answered. For AnswerSheets, that is whether any sheet follows a layout
+    that holds one of them."""
+    if Answer.objects.filter(Q(question__in=question_ids) | Q(option__in=option_ids)).exists():
+        return True
+    question_ids, option_ids = set(question_ids), set(option_ids)
+    for version in QuestionnaireVersion.objects.filter(answersheet__isnull=False).distinct():
+        for question_id, options in version.get_layout():
+            if question_id in question_ids or option_ids.intersection(options):
+                return True
+    return False
+
+def apply(changes):
+    Question.objects.bulk_create(changes.new_questions)
+    Option.objects.bulk_create(changes.new_options, BATCH_SIZE)
+    for question_id, text in changes.renamed_questions:
+        Question.objects.filter(id=question_id).update(text=text)
+    if changes.deleted_options:
+        Option.objects.filter(id__in=changes.deleted_options).delete()
+    if changes.deleted_questions:
+        Question.objects.filter(id__in=changes.deleted_questions).delete()
+
+@transaction.commit_on_success
+def update(spec, dry_run=False):
+    changes = diff(spec)
+    if changes and not dry_run:
+        apply(changes)
+    return changes
+
+def load(spec, dry_run=False):
+    """Bring the database in line with the given spec and return the Changes."""
+    changes = update(spec, dry_run)
+    if changes and not dry_run:
+        # Only now that the changes are committed. Bulk inserts and updates
+        # don't send the signals that would do this.
+        invalidate_questionnaire()
+    return changes
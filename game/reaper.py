@@ -0,0 +1,90 @@
+"""Removal of abandoned players and expired sessions.
+
+Every visitor of the game gets a Player, whether or not they go on to play.
+reap_players() deletes the players that registered longer ago than a given age
+without finishing the game: by default only those that never played a round,
+optionally also those that gave up halfway (along with their rounds and
+answers). reap_sessions() deletes expired sessions from the database.
+
+Both work in small batches, each in a transaction of its own, so locks are only
+held briefly and the game can keep running meanwhile. A player is only deleted
+if it is still abandoned once its row is locked, so a participant that comes
+back at the last moment is left alone.
+
+Deleted players are no longer counted towards their kind's KindCounter, so that
+game.allocation assigns new players to make up for them. The dashboard's
+SummaryCounters count events, and are left alone.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from game.models import KindCounter, Player
+
+BATCH_SIZE = 100
+DEFAULT_MAX_AGE = timedelta(days=2)
+
+# The session engines that keep sessions in the database.
+DB_SESSION_ENGINES = ('django.contrib.sessions.backends.db',
+                      'django.contrib.sessions.backends.cached_db')
+
+def abandoned_players(max_age=DEFAULT_MAX_AGE, include_partial=False):
+    players = Player.objects.filter(mturk_key='0',
+                                    registration_datetime__lt=timezone.now() - max_age)
+    if not include_partial:
+        players = players.filter(rounds_played=0)
+    return players
+
+@transaction.commit_on_success
+def delete_players(player_ids, max_age, include_partial):
+    """Delete those of the given players that are still abandoned. Return the
+    number of players deleted per kind."""
+    players = abandoned_players(max_age, include_partial).select_for_update().filter(
+        id__in=player_ids).values_list('id', 'opponent_kind')
+    deleted = {}
+    for player_id, kind_id in players:
+        deleted.setdefault(kind_id, []).append(player_id)
+    for kind_id, ids in deleted.items():
+        Player.objects.filter(id__in=ids).delete()
+        KindCounter.objects.filter(kind=kind_id).update(num_players=F('num_players') - len(ids))
+    return dict((kind_id, len(ids)) for kind_id, ids in deleted.items())
+
+def reap_players(max_age=DEFAULT_MAX_AGE, include_partial=False, batch_size=BATCH_SIZE,
+                 pause=0):
+    """Delete abandoned players, batch_size at a time, waiting pause seconds
+    between batches. Return the number of players deleted per kind."""
+    deleted = {}
+    last = 0
+    while True:
+        player_ids = list(abandoned_players(max_age, include_partial).filter(
+            id__gt=last).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not player_ids:
+            return deleted
+        last = player_ids[-1]
+        for kind_id, count in delete_players(player_ids, max_age, include_partial).items():
+            deleted[kind_id] = deleted.get(kind_id, 0) + count
+        if pause:
+            time.sleep(pause)
+
+def reap_sessions(batch_size=BATCH_SIZE, pause=0):
+    """Delete expired sessions, batch_size at a time. Return the number of
+    sessions deleted, or None if sessions are not kept in the database."""
+    if settings.SESSION_ENGINE not in DB_SESSION_ENGINES:
+        return None
+    from django.contrib.sessions.models import Session
+
+    deleted = 0
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=timezone.now()).values_list(
+            'session_key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        with transaction.commit_on_success():
+            Session.objects.filter(session_key__in=keys).delete()
+        deleted += len(keys)
+        if pause:
+            time.sleep(pause)
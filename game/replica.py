@@ -0,0 +1,117 @@
+"""Reads from a replica of the database, for workloads that don't need the
+latest data.
+
+The export, the analysis, the dashboard and the admin's list views scan large
+parts of the tables. Within replica_reads() (or a view decorated with
+use_replica), ReplicaRouter sends their reads to the GAME_REPLICA_DATABASE
+alias, so they don't slow down the database that serves the participants. All
+writes, and all reads outside replica_reads() (such as those of the game, which
+must see what it just wrote), go to the default database. Without a replica in
+DATABASES, everything goes to the default database.
+
+A replica lags behind; GAME_REPLICA_MAX_LAG (in seconds) is how far at most,
+which the incremental export takes into account.
+
+For a local test, copy_replica() stands in for replication between two SQLite
+databases (see the copy_replica command and ultimatum_game/settings_replica.py).
+"""
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+
+# As in django.db, which can't be imported here, as importing it loads the
+# routers.
+DEFAULT_DB_ALIAS = 'default'
+REPLICA = getattr(settings, 'GAME_REPLICA_DATABASE', 'replica')
+MAX_LAG = timedelta(seconds=getattr(settings, 'GAME_REPLICA_MAX_LAG', 0))
+
+_state = threading.local()
+
+class ReplicaError(Exception):
+    pass
+
+def has_replica():
+    return REPLICA in settings.DATABASES
+
+def reading_replica():
+    """Return whether reads in this thread currently go to the replica."""
+    return getattr(_state, 'replica', False) and has_replica()
+
+@contextmanager
+def replica_reads():
+    """Send the reads within to the replica (if there is one)."""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+def use_replica(view):
+    """Decorate a read-only view to read from the replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+def get_lag():
+    """Return how far behind the data read here might be."""
+    return MAX_LAG if reading_replica() else timedelta(0)
+
+def other_database(hints):
+    """Return the database of the instance in hints if it is neither the
+    default database nor the replica (e.g. an archive; see game.archive)."""
+    instance = hints.get('instance')
+    if instance is not None and instance._state.db not in (None, DEFAULT_DB_ALIAS, REPLICA):
+        return instance._state.db
+    return None
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        db = other_database(hints)
+        if db is None and reading_replica():
+            return REPLICA
+        return db
+
+    def db_for_write(self, model, **hints):
+        # Also for instances read from the replica.
+        return other_database(hints) or DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (DEFAULT_DB_ALIAS, REPLICA)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        # The replica gets its tables from the default database.
+        if db == REPLICA:
+            return False
+        return None
+
+def copy_replica():
+    """Replace the replica with a copy of the default database. Only for
+    SQLite databases, to test replica reads locally."""
+    if not has_replica():
+        raise ReplicaError('There is no %r database.' % REPLICA)
+    source, target = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[REPLICA]
+    if not (source['ENGINE'].endswith('sqlite3') and target['ENGINE'].endswith('sqlite3')):
+        raise ReplicaError('Only SQLite databases can be copied; use the replication '
+                           'of the database server instead.')
+    tmp_path = target['NAME'] + '.tmp'
+    # Keep writers out while copying, so the copy is consistent.
+    connection = sqlite3.connect(source['NAME'], isolation_level=None)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        shutil.copyfile(source['NAME'], tmp_path)
+        connection.execute('ROLLBACK')
+    finally:
+        connection.close()
+    os.rename(tmp_path, target['NAME'])
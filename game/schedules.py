@@ -0,0 +1,136 @@
+"""Per-player schedules of opponents, offers and intents.
+
+A schedule is drawn up once, when a player registers, and stored on the player
+in a compact string form (see Schedule.encode). Every round then simply looks
+up its opponent, offer and intent in the schedule.
+
+The generator used for new players is configured by the GAME_SCHEDULE_GENERATOR
+setting, which holds the dotted path of a ScheduleGenerator subclass.
+"""
+import random
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+
+from game.models import Kind
+
+# The offers made in each half of the game; the halves differ in intent.
+OFFERS = [10, 20, 30, 50]
+
+# XXX: The original experiment hard-coded eight distinct offer sequences that
+# were "symmetric": the second half mirrors the first, so the fourth and fifth
+# offer are always identical. The sequences themselves were not preserved;
+# these eight have that same shape.
+SYMMETRIC_OFFER_SEQUENCES = [
+    [10, 20, 30, 50, 50, 30, 20, 10],
+    [10, 30, 50, 20, 20, 50, 30, 10],
+    [20, 10, 50, 30, 30, 50, 10, 20],
+    [20, 50, 10, 30, 30, 10, 50, 20],
+    [30, 10, 20, 50, 50, 20, 10, 30],
+    [30, 50, 20, 10, 10, 20, 50, 30],
+    [50, 20, 10, 30, 30, 10, 20, 50],
+    [50, 30, 20, 10, 10, 20, 30, 50],
+]
+
+DEFAULT_GENERATOR = 'game.schedules.RandomScheduleGenerator'
+
+class Schedule(object):
+    """The opponents, offers and intents of all rounds of a single player."""
+
+    def __init__(self, opponents, offers, intents):
+        assert len(opponents) == len(offers) == len(intents)
+        self.opponents = opponents
+        self.offers = offers
+        self.intents = intents
+
+    def __len__(self):
+        return len(self.opponents)
+
+    def encode(self):
+        """Encode the schedule as e.g. '11110000;3,1,...;10,30,...'."""
+        return '%s;%s;%s' % (''.join('1' if i else '0' for i in self.intents),
+                             ','.join(str(o) for o in self.opponents),
+                             ','.join(str(o) for o in self.offers))
+
+    @classmethod
+    def decode(cls, value):
+        intents, opponents, offers = value.split(';')
+        return cls([int(o) for o in opponents.split(',')],
+                   [int(o) for o in offers.split(',')],
+                   [i == '1' for i in intents])
+
+class ScheduleGenerator(object):
+    """Base class of the strategies that draw up a player's schedule."""
+
+    def generate(self, kind, opponent_ids):
+        """Return the Schedule of a player playing the given opponents.
+
+        All opponents are played exactly once, so the number of rounds equals
+        the number of opponents.
+        """
+        raise NotImplementedError
+
+    def shuffled(self, values):
+        values = list(values)
+        random.shuffle(values)
+        return values
+
+    def halves(self, kind, num_rounds):
+        """Return the intents of all rounds: one intent per half of the game.
+
+        The opponents of the nondeterministic kind cannot have intentions at
+        all, so none of their offers are intentional.
+        """
+        if kind.id == Kind.ID_NONDETERMINISTIC:
+            return [False] * num_rounds
+        first = random.choice([True, False])
+        half = num_rounds // 2
+        return [first] * half + [not first] * (num_rounds - half)
+
+class RandomScheduleGenerator(ScheduleGenerator):
+    """Opponents in random order; each half gets every offer in random order.
+
+    Without intents there are no halves, so all offers are shuffled together.
+    """
+
+    def generate(self, kind, opponent_ids):
+        num_rounds = len(opponent_ids)
+        # XXX: For some reason an offer of 40 was never made. As long as there
+        # are as many offers as opponents, there's no problem. (Of course,
+        # during statistical analysis one must keep in mind that players did
+        # not receive exactly the same offers.)
+        assert len(OFFERS) * 2 == num_rounds
+        if kind.id == Kind.ID_NONDETERMINISTIC:
+            offers = self.shuffled(OFFERS * 2)
+        else:
+            offers = self.shuffled(OFFERS) + self.shuffled(OFFERS)
+        return Schedule(self.shuffled(opponent_ids), offers,
+                        self.halves(kind, num_rounds))
+
+class SymmetricScheduleGenerator(ScheduleGenerator):
+    """Opponents in random order; offers follow one of the symmetric sequences
+    of the original experiment."""
+
+    def generate(self, kind, opponent_ids):
+        offers = list(random.choice(SYMMETRIC_OFFER_SEQUENCES))
+        assert len(offers) == len(opponent_ids)
+        return Schedule(self.shuffled(opponent_ids), offers,
+                        self.halves(kind, len(offers)))
+
+_generator = None
+
+def get_schedule_generator():
+    global _generator
+    if _generator is None:
+        path = getattr(settings, 'GAME_SCHEDULE_GENERATOR', DEFAULT_GENERATOR)
+        module_name, _, class_name = path.rpartition('.')
+        try:
+            generator_class = getattr(import_module(module_name), class_name)
+        except (ImportError, AttributeError) as e:
+            raise ImproperlyConfigured('Cannot import schedule generator %s: %s' % (path, e))
+        _generator = generator_class()
+    return _generator
+
+def generate_schedule(kind, opponent_ids):
+    return get_schedule_generator().generate(kind, opponent_ids)
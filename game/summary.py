@@ -0,0 +1,65 @@
+"""Counters summarizing the progress of a study, for the dashboard.
+
+Every milestone of a participant (starting the game, viewing the instructions,
+playing a round, finishing the questionnaire, receiving the MTurk key) and the
+outcome of every offer is counted as it happens, in a SummaryCounter row. The
+dashboard thus only needs to read a few dozen small rows, however many
+participants there are. rebuild() recomputes all counters from scratch, e.g.
+after upgrading a database that already holds participants.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from game.models import Player, Round, SummaryCounter
+
+STARTED = 'started'
+INSTRUCTIONS = 'instructions'
+QUESTIONNAIRE = 'questionnaire'
+THANKYOU = 'thankyou'
+
+def round_stage(round_number):
+    return 'round:%d' % round_number
+
+def offer_outcome(kind_id, amount_offered, is_intentional, accepted):
+    return 'offer:%s:%d:%d:%s' % (kind_id, amount_offered, int(is_intentional),
+                                  'accepted' if accepted else 'rejected')
+
+def increment(name, amount=1):
+    if not SummaryCounter.objects.filter(name=name).update(value=F('value') + amount):
+        SummaryCounter.objects.get_or_create(name=name)
+        SummaryCounter.objects.filter(name=name).update(value=F('value') + amount)
+
+def record_round(player, round):
+    """Count a round that was just saved (by Player.record_round)."""
+    increment(round_stage(player.rounds_played))
+    increment(offer_outcome(player.opponent_kind_id, round.amount_offered,
+                            round.is_intentional, round.accepted))
+
+def get_counters():
+    return dict(SummaryCounter.objects.values_list('name', 'value'))
+
+@transaction.commit_on_success
+def rebuild():
+    """Recompute all counters from the players and rounds in the database.
+
+    Whether a participant started the game is only known to its session, so
+    the number of players is used instead.
+    """
+    players = Player.objects.all()
+    counters = {
+        STARTED: players.count(),
+        INSTRUCTIONS: players.exclude(start_time=-1).count(),
+        QUESTIONNAIRE: players.exclude(questionnaire_time=-1).count(),
+        THANKYOU: players.exclude(mturk_key='0').count(),
+    }
+    for played in players.values('rounds_played').annotate(num_players=Count('id')):
+        for n in range(1, played['rounds_played'] + 1):
+            counters[round_stage(n)] = counters.get(round_stage(n), 0) + played['num_players']
+    for o in Round.objects.values('player__opponent_kind', 'amount_offered', 'is_intentional',
+                                  'accepted').annotate(num_rounds=Count('id')):
+        counters[offer_outcome(o['player__opponent_kind'], o['amount_offered'],
+                               o['is_intentional'], o['accepted'])] = o['num_rounds']
+
+    SummaryCounter.objects.all().delete()
+    SummaryCounter.objects.bulk_create([SummaryCounter(name=name, value=value)
+                                        for name, value in counters.items()])
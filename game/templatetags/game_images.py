@@ -0,0 +1,11 @@
+from django import template
+
+from game.images import variant_url
+
+register = template.Library()
+
+@register.simple_tag
+def image(path, variant='full'):
+    """The URL of a variant of a static image (see game.images), e.g.
+    {% image 'game/pictures/c_1.jpg' %}."""
+    return variant_url(path, variant)
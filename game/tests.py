@@ -0,0 +1,705 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+from datetime import timedelta
+from StringIO import StringIO
+from uuid import uuid1
+
+import numpy as np
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from game import (allocation, analysis, answers, archive, benchmark, columnar, export,
+                  questionnaire_spec, reaper, replica, summary, views)
+from game.loadtest import Participant
+from game.models import (Answer, AnswerSheet, Kind, KindCounter, Opponent, Option, Player,
+                         Question, Round, SummaryCounter)
+from game.questionnaire import get_questionnaire, invalidate_if_changed
+from game.schedules import Schedule
+
+# A questionnaire of two pages.
+SPEC = [{'text': 'Question %d' % i, 'options': ['Yes', 'No', 'Maybe']} for i in range(8)]
+
+def prefer_kind(kind):
+    """Make sure the next player plays the given kind of opponent."""
+    KindCounter.objects.all().delete()
+    for kind_id, _ in Kind.IDS:
+        KindCounter.objects.create(kind_id=kind_id, num_players=0 if kind_id == kind else 1)
+
+def setup_game(kind='h'):
+    cache.clear()
+    questionnaire_spec.load(SPEC)
+    get_questionnaire()
+    prefer_kind(kind)
+
+def add_finished_player(kind_id='h', accepted=(True, False) * 4, option=0,
+                        finished_datetime=None):
+    """Add a player that finished the game, having accepted the offers as
+    given and chosen the given option for every question."""
+    player = Player.objects.create(
+        opponent_kind_id=kind_id, mturk_key=uuid1().hex,
+        finished_datetime=finished_datetime or timezone.now() - timedelta(hours=1),
+        start_time=1000, instructions_time=2000, questionnaire_time=3000,
+        age='30', hours_a_day_you_spend_behind_a_computer='4', nationality='Dutch',
+        rounds_played=len(accepted))
+    for i, (opponent, a) in enumerate(zip(Opponent.objects.filter(kind=kind_id), accepted)):
+        Round.objects.create(player=player, opponent=opponent, amount_offered=10 * (i % 4 + 1),
+                             is_intentional=i < 4, accepted=a, time_elapsed=1000 * (i + 1))
+    Answer.objects.bulk_create([Answer(player=player, question_id=q.id,
+                                       option_id=q.options[option][0])
+                                for q in get_questionnaire().questions])
+    return player
+
+def read_csv(data):
+    rows = list(csv.reader(StringIO(data)))
+    return rows[0], rows[1:]
+
+# The tests keep their archives (see game.archive) here, rather than in
+# GAME_ARCHIVE_DIR.
+TEST_ARCHIVE_DIR = os.path.join(tempfile.gettempdir(), 'ultimatum_game_test_archives')
+
+class ArchivesTestCase(TestCase):
+    """A TestCase with archives of its own, which start out empty."""
+
+    def setUp(self):
+        self.archive_dir = archive.ARCHIVE_DIR
+        archive.ARCHIVE_DIR = TEST_ARCHIVE_DIR
+        self.remove_archives()
+
+    def tearDown(self):
+        self.remove_archives()
+        archive.ARCHIVE_DIR = self.archive_dir
+
+    def remove_archives(self):
+        for name in archive.list_archives():
+            alias = archive.open_archive(name)
+            connections[alias].close()
+            del connections.databases[alias]
+        shutil.rmtree(TEST_ARCHIVE_DIR, ignore_errors=True)
+
+class ViewQueriesTest(TestCase):
+    """Pins the number of queries every game view runs, so that changes which
+    bring back per-round or per-question queries are caught."""
+    # The number of finished players in the database beforehand.
+    PLAYERS = 0
+
+    def setUp(self):
+        setup_game()
+        if self.PLAYERS:
+            benchmark.populate(self.PLAYERS)
+            prefer_kind('h')
+        self.client.get(reverse('game:start_game'))
+        self.client.get(reverse('game:view_instructions'))
+        self.player = Player.objects.latest('id')
+        # Create the dashboard counters the player will bump, so that bumping
+        # one always takes a single query, whoever played before.
+        schedule = Schedule.decode(self.player.schedule)
+        names = [summary.round_stage(n) for n in range(1, len(schedule) + 1)]
+        names += [summary.offer_outcome(self.player.opponent_kind_id, offer, intent, accepted)
+                  for offer, intent in zip(schedule.offers, schedule.intents)
+                  for accepted in (True, False)]
+        for name in names + [summary.QUESTIONNAIRE, summary.THANKYOU]:
+            SummaryCounter.objects.get_or_create(name=name)
+
+    def get(self, name, queries, status=200):
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def post(self, name, data, queries, status=303):
+        with self.assertNumQueries(queries):
+            response = self.client.post(reverse(name), data)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def answer_page(self, number, queries):
+        data = dict(('%d-option' % q.id, q.options[0][0])
+                    for q in get_questionnaire().page(number))
+        self.post('game:questionnaire', data, queries)
+
+    def test_intentionality(self):
+        # Saving the session takes two queries.
+        self.get('game:start_round', 5, status=303)
+        self.get('game:intentionality', 2)
+        self.post('game:intentionality', {'checked': 'on'}, 4)
+
+    def test_rounds(self):
+        self.get('game:start_round', 5, status=303)
+        self.client.post(reverse('game:intentionality'), {'checked': 'on'})
+        for number in range(1, 9):
+            if number == 5:
+                # The second half starts with the intentionality page again.
+                self.get('game:start_round', 4, status=303)
+                self.client.post(reverse('game:intentionality'), {'checked': 'on'})
+            # The opponent is kept in the session, unless that happened above.
+            self.get('game:start_round', 2 if number in (1, 5) else 4)
+            self.get('game:play_round', 3)
+            self.post('game:play_round', {'accepted': number % 2 == 0, 'time_elapsed': 1000}, 8)
+            # The last round has no next opponent to look up.
+            self.get('game:end_round', 6 if number < 8 else 5)
+        self.assertEqual(Player.objects.get(id=self.player.id).rounds_played, 8)
+        self.get('game:start_round', 1, status=303)
+
+    def test_play_twice(self):
+        self.get('game:start_round', 5, status=303)
+        self.client.post(reverse('game:intentionality'), {'checked': 'on'})
+        self.get('game:start_round', 2)
+        data = {'accepted': True, 'time_elapsed': 1000}
+        self.client.post(reverse('game:play_round'), data)
+        # A double click, or a browser retrying the request.
+        response = self.post('game:play_round', data, 3)
+        self.assertTrue(response['Location'].endswith(reverse('game:end_round')))
+        self.assertEqual(self.player.round_set.count(), 1)
+        self.assertEqual(Player.objects.get(id=self.player.id).rounds_played, 1)
+
+    def test_answer_page_twice(self):
+        save_answers = views.save_answers
+        def save_concurrently(player, answers):
+            # A double click: the other submission saved the same answers first.
+            save_answers(player, answers)
+            raise IntegrityError('columns player_id, question_id are not unique')
+        views.save_answers = save_concurrently
+        try:
+            self.answer_page(1, 5)
+        finally:
+            views.save_answers = save_answers
+        self.assertEqual(Answer.objects.filter(player=self.player).count(),
+                         len(get_questionnaire().page(1)))
+        response = self.get('game:questionnaire', 1)
+        self.assertEqual([q.id for q, form in response.context['questions_forms']],
+                         [q.id for q in get_questionnaire().page(2)])
+
+    def test_questionnaire(self):
+        self.get('game:questionnaire', 3)
+        self.answer_page(1, 5)
+        self.get('game:questionnaire', 1)
+        # The last page also records the time the questionnaire took.
+        self.answer_page(2, 7)
+        self.get('game:questionnaire', 1, status=303)
+
+class PopulatedViewQueriesTest(ViewQueriesTest):
+    """The same, with other players in the database: the number of queries
+    must not grow with the number of players."""
+    PLAYERS = 200
+
+class AllocationTest(TestCase):
+    def test_initialize_counters(self):
+        # Players that registered before there were counters.
+        for kind_id, count in [('c', 3), ('h', 2), ('n', 3), ('r', 3)]:
+            for i in range(count):
+                Player.objects.create(opponent_kind_id=kind_id)
+        self.assertEqual(allocation.allocate_kind().id, 'h')
+        self.assertEqual(dict(KindCounter.objects.values_list('kind', 'num_players')),
+                         {'c': 3, 'h': 3, 'n': 3, 'r': 3})
+
+    def test_gives_up(self):
+        for kind_id, _ in Kind.IDS:
+            KindCounter.objects.create(kind_id=kind_id, num_players=1)
+        get_counters = allocation.get_counters
+        # Every compare-and-swap loses, as if other players always got there first.
+        allocation.get_counters = lambda: [KindCounter(kind_id='h', num_players=0)]
+        try:
+            self.assertRaises(RuntimeError, allocation.allocate_kind)
+        finally:
+            allocation.get_counters = get_counters
+        self.assertEqual(set(KindCounter.objects.values_list('num_players', flat=True)), set([1]))
+
+class ConcurrentAllocationTest(TransactionTestCase):
+    THREADS = 8
+    PLAYERS_PER_THREAD = 10
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] == ':memory:':
+            self.skipTest('An in-memory SQLite database is not shared between threads.')
+
+    def register(self, errors):
+        try:
+            for i in range(self.PLAYERS_PER_THREAD):
+                Player.objects.create(opponent_kind=allocation.allocate_kind())
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_balance(self):
+        errors = []
+        threads = [threading.Thread(target=self.register, args=(errors,))
+                   for i in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+        counters = dict(KindCounter.objects.values_list('kind', 'num_players'))
+        players = dict(Kind.objects.annotate(num_players=Count('player')).values_list(
+            'id', 'num_players'))
+        self.assertEqual(counters, players)
+        self.assertEqual(sum(players.values()), self.THREADS * self.PLAYERS_PER_THREAD)
+        self.assertTrue(max(players.values()) - min(players.values()) <= 1, players)
+
+class QuestionnaireCacheTest(TestCase):
+    def setUp(self):
+        setup_game()
+
+    def test_load(self):
+        version = get_questionnaire().version
+        questionnaire_spec.load(SPEC + [{'text': 'Another question', 'options': ['Yes', 'No']}])
+        self.assertNotEqual(get_questionnaire().version, version)
+        self.assertEqual(get_questionnaire().questions[-1].text, 'Another question')
+
+    def test_invalidated_after_commit(self):
+        version = get_questionnaire().version
+        with transaction.commit_on_success():
+            Question.objects.create(text='Another question')
+            # Not before the change is committed.
+            self.assertEqual(get_questionnaire().version, version)
+        invalidate_if_changed()
+        self.assertEqual(get_questionnaire().questions[-1].text, 'Another question')
+
+class ExportTest(ArchivesTestCase):
+    def setUp(self):
+        super(ExportTest, self).setUp()
+        setup_game()
+        self.players = [add_finished_player('h'), add_finished_player('c', option=1)]
+        # Not finished.
+        Player.objects.create(opponent_kind_id='h')
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'export.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ExportTest, self).tearDown()
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return read_csv(f.read())
+
+    def test_csv(self):
+        f = StringIO()
+        self.assertEqual(export.export_csv(f), 16)
+        header, rows = read_csv(f.getvalue())
+        self.assertEqual(header, export.COLUMNS + [q['text'] for q in SPEC])
+        self.assertEqual([int(r[1]) for r in rows],
+                         list(Round.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(rows[0][:7], [str(self.players[0].id), str(rows[0][1]),
+                                       rows[0][2], 'h', 'True', '10', 'True'])
+        self.assertEqual(set(tuple(r[len(export.COLUMNS):]) for r in rows[:8]),
+                         set([('Yes',) * len(SPEC)]))
+        self.assertEqual(set(tuple(r[len(export.COLUMNS):]) for r in rows[8:]),
+                         set([('No',) * len(SPEC)]))
+
+    def test_incremental(self):
+        self.assertEqual(export.export_file(self.path, incremental=True), 16)
+        # As if the export ran half an hour ago.
+        watermark = timezone.now() - timedelta(minutes=30)
+        export.write_watermark(self.path, watermark, os.path.getsize(self.path))
+        player = add_finished_player('r', finished_datetime=watermark + timedelta(minutes=1))
+        self.assertEqual(export.export_file(self.path, incremental=True), 8)
+        header, rows = self.read()
+        self.assertEqual(len(rows), 24)
+        self.assertEqual(set(int(r[0]) for r in rows[16:]), set([player.id]))
+        self.assertTrue(export.read_watermark(self.path)[0] > watermark)
+
+    def test_incremental_after_failure(self):
+        export.export_file(self.path)
+        watermark, size = export.read_watermark(self.path)
+        # Rows appended by an export that failed before writing its watermark.
+        with open(self.path, 'ab') as f:
+            f.write('1,2,3\r\n')
+        export.write_watermark(self.path, timezone.now() - timedelta(minutes=30), size)
+        self.assertEqual(export.export_file(self.path, incremental=True), 0)
+        header, rows = self.read()
+        self.assertEqual(len(rows), 16)
+
+    def test_incremental_after_questions_changed(self):
+        export.export_file(self.path)
+        with open(self.path, 'rb') as f:
+            before = f.read()
+        questionnaire_spec.load(SPEC + [{'text': 'Another question', 'options': ['Yes', 'No']}])
+        self.assertRaises(export.ExportError, export.export_file, self.path, True)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+        # Exporting in full starts over with the new columns.
+        export.export_file(self.path)
+        header, rows = self.read()
+        self.assertEqual(header[-1], 'Another question')
+
+class ColumnarTest(ArchivesTestCase):
+    def setUp(self):
+        super(ColumnarTest, self).setUp()
+        setup_game()
+        add_finished_player('h')
+        add_finished_player('c', accepted=(False,) * 8, option=2)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ColumnarTest, self).tearDown()
+
+    def read_columns(self):
+        with open(os.path.join(self.directory, columnar.SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        typecodes = dict((dtype, typecode) for typecode, dtype in columnar.TYPES.values())
+        columns = {}
+        for c in schema['columns'] + schema['questions']:
+            values = array(typecodes[c['dtype']])
+            with open(os.path.join(self.directory, c['file']), 'rb') as f:
+                values.fromfile(f, schema['rows'])
+            columns[c['name']] = values.tolist()
+        return columns
+
+    def test_columns(self):
+        self.assertEqual(columnar.export_columns(self.directory), 16)
+        columns = self.read_columns()
+        rounds = list(Round.objects.order_by('id'))
+        self.assertEqual(columns['round'], [r.id for r in rounds])
+        self.assertEqual(columns['amount_offered'], [r.amount_offered for r in rounds])
+        self.assertEqual(columns['accepted'], [r.accepted for r in rounds])
+        self.assertEqual(columns['opponent_kind'], ['h'] * 8 + ['c'] * 8)
+        self.assertEqual([columns['q%d' % q.id] for q in get_questionnaire().questions],
+                         [[0] * 8 + [2] * 8] * 8)
+
+    def test_load_columns(self):
+        columnar.export_columns(self.directory)
+        rounds, answers = analysis.load_columns(self.directory)
+        expected = analysis.load_rounds()
+        for name in analysis.Rounds._fields:
+            self.assertEqual(list(getattr(rounds, name)), list(getattr(expected, name)))
+        self.assertEqual(answers.answers.tolist(), analysis.load_answers().answers.tolist())
+        self.assertEqual(answers.answers.tolist(), [[0] * 8, [2] * 8])
+
+class AnalysisTest(TestCase):
+    def rounds(self, accepted, time_elapsed=None):
+        n = len(accepted)
+        return analysis.Rounds(np.arange(n, dtype=np.int32), np.zeros(n, dtype=np.int8),
+                               np.full(n, 50, dtype=np.int16), np.ones(n, dtype=bool),
+                               np.array(accepted, dtype=bool),
+                               np.array(time_elapsed or [1000] * n, dtype=np.int32))
+
+    def test_acceptance_rates(self):
+        rounds = self.rounds([True] * 6 + [False] * 4)
+        [row] = analysis.acceptance_rates(rounds, seed=1)
+        self.assertEqual((row['kind'], row['amount_offered'], row['is_intentional']),
+                         ('h', 50, True))
+        self.assertEqual((row['n'], row['accepted'], row['rate']), (10, 6, 0.6))
+        self.assertTrue(0.2 < row['low'] < 0.6 < row['high'] < 1.0, row)
+        self.assertEqual(analysis.acceptance_rates(rounds, seed=1), [row])
+
+    def test_acceptance_rates_certain(self):
+        [row] = analysis.acceptance_rates(self.rounds([True] * 5))
+        self.assertEqual((row['rate'], row['low'], row['high']), (1.0, 1.0, 1.0))
+
+    def test_response_times(self):
+        [row] = analysis.response_times(self.rounds([True] * 5, [500, 100, 400, 200, 300]))
+        self.assertEqual((row['n'], row['mean'], row['p50'], row['p25'], row['p5']),
+                         (5, 300.0, 300.0, 200.0, 120.0))
+
+    def test_questionnaire_scores(self):
+        setup_game()
+        questions = get_questionnaire().questions
+        answers = analysis.Answers(np.array([1, 2]), questions,
+                                   np.array([[0] * 8, [2, 1] + [-1] * 6], dtype=np.int8))
+        scales, scores = analysis.questionnaire_scores(answers)
+        self.assertEqual(scales, [(('Yes', 'No', 'Maybe'), [q.id for q in questions])])
+        self.assertEqual(scores.tolist(), [[0.0], [0.75]])
+
+class SummaryTest(TestCase):
+    def setUp(self):
+        setup_game()
+
+    def test_increment(self):
+        summary.increment(summary.STARTED)
+        summary.increment(summary.STARTED, 2)
+        self.assertEqual(summary.get_counters(), {summary.STARTED: 3})
+
+    def test_rebuild(self):
+        for kind_id in 'hcr':
+            add_finished_player(kind_id)
+        # Not finished.
+        Player.objects.create(opponent_kind_id='h', rounds_played=1)
+        summary.increment(summary.STARTED, 10)
+        summary.rebuild()
+        counters = summary.get_counters()
+        self.assertEqual([counters[name] for name in (summary.STARTED, summary.INSTRUCTIONS,
+                                                      summary.QUESTIONNAIRE, summary.THANKYOU)],
+                         [4, 3, 3, 3])
+        self.assertEqual(counters[summary.round_stage(1)], 4)
+        self.assertEqual(counters[summary.round_stage(8)], 3)
+        self.assertEqual(counters[summary.offer_outcome('h', 10, True, True)], 1)
+        self.assertEqual(sum(v for name, v in counters.items() if name.startswith('offer:')), 24)
+
+    def test_rebuild_after_playing(self):
+        for i in range(3):
+            Participant().play()
+        counters = summary.get_counters()
+        self.assertEqual(counters[summary.THANKYOU], 3)
+        self.assertEqual(counters[summary.round_stage(8)], 3)
+        SummaryCounter.objects.all().delete()
+        summary.rebuild()
+        self.assertEqual(summary.get_counters(), counters)
+
+class QuestionnaireSpecTest(TestCase):
+    def setUp(self):
+        setup_game()
+        self.player = Player.objects.create(opponent_kind_id='h')
+
+    def test_unchanged(self):
+        self.assertFalse(questionnaire_spec.load(SPEC))
+
+    def test_add_and_remove(self):
+        spec = SPEC[1:] + [{'text': 'Another question', 'options': ['Yes', 'No']}]
+        spec[0] = {'text': spec[0]['text'], 'options': ['Yes', 'No', 'Maybe', 'Never']}
+        changes = questionnaire_spec.load(spec)
+        self.assertEqual((len(changes.new_questions), len(changes.new_options),
+                          len(changes.deleted_questions), len(changes.deleted_options)),
+                         (1, 3, 1, 3))
+        self.assertEqual([(q.text, [o[1] for o in q.options]) for q in get_questionnaire().questions],
+                         [(q['text'], q['options']) for q in spec])
+
+    def test_dry_run(self):
+        changes = questionnaire_spec.load(SPEC[1:], dry_run=True)
+        self.assertEqual(len(changes.deleted_questions), 1)
+        self.assertEqual(Question.objects.count(), len(SPEC))
+
+    def test_answered(self):
+        question = get_questionnaire().questions[0]
+        Answer.objects.create(player=self.player, question_id=question.id,
+                              option_id=question.options[2][0])
+        self.assertRaises(questionnaire_spec.SpecError, questionnaire_spec.load, SPEC[1:])
+        spec = [{'text': SPEC[0]['text'], 'options': ['Yes', 'No']}] + SPEC[1:]
+        self.assertRaises(questionnaire_spec.SpecError, questionnaire_spec.load, spec)
+        self.assertEqual(Question.objects.count(), len(SPEC))
+        self.assertEqual(Option.objects.count(), 3 * len(SPEC))
+
+    def test_reordered(self):
+        self.assertRaises(questionnaire_spec.SpecError, questionnaire_spec.load,
+                          [SPEC[1], SPEC[0]] + SPEC[2:])
+
+class AnswerSheetTest(TestCase):
+    def setUp(self):
+        setup_game()
+        self.player = Player.objects.create(opponent_kind_id='h')
+
+    def save(self, player, choices):
+        """Save the given {question index: option index} as a page."""
+        questions = get_questionnaire().questions
+        answers.save_answers(player, [Answer(player=player, question_id=questions[q].id,
+                                             option_id=questions[q].options[o][0])
+                                      for q, o in choices.items()])
+
+    def add_question(self):
+        questionnaire_spec.load(SPEC + [{'text': 'Another question', 'options': ['Yes', 'No']}])
+
+    def test_encode(self):
+        layout = ((1, (10, 11, 12)), (2, (20, 21)), (3, (30, 31)))
+        self.assertEqual(answers.encode(layout, {1: 12, 2: 20}), '20-')
+        self.assertEqual(answers.decode(layout, '20-'), {1: 12, 2: 20})
+        # Not in the layout.
+        self.assertEqual(answers.encode(layout, {1: 20, 4: 40}), '---')
+        self.assertFalse(answers.fits(layout, {1: 20}))
+        self.assertTrue(answers.fits(layout, {1: 12, 3: 31}))
+
+    @override_settings(GAME_ANSWER_STORAGE='sheets')
+    def test_keeps_version(self):
+        self.save(self.player, {0: 1, 1: 2})
+        version = AnswerSheet.objects.get(player=self.player).version_id
+        self.add_question()
+        # The questions of the sheet's version are answered along it.
+        self.save(self.player, {2: 0})
+        self.assertEqual(AnswerSheet.objects.get(player=self.player).version_id, version)
+        # A new question requires the new version.
+        self.save(self.player, {8: 1})
+        sheet = AnswerSheet.objects.get(player=self.player)
+        self.assertNotEqual(sheet.version_id, version)
+        self.assertEqual(sheet.answers, '120-----1')
+
+    @override_settings(GAME_ANSWER_STORAGE='sheets')
+    def test_refuses_loss(self):
+        self.save(self.player, {0: 1})
+        self.add_question()
+        # Removed through the admin, while the sheet's answer refers to it.
+        Option.objects.filter(id=get_questionnaire().questions[0].options[1][0]).delete()
+        invalidate_if_changed()
+        self.assertRaises(answers.AnswerSheetError, self.save, self.player, {8: 1})
+        self.assertEqual(AnswerSheet.objects.get(player=self.player).answers, '1-------')
+
+    @override_settings(GAME_ANSWER_STORAGE='sheets')
+    def test_get_answers(self):
+        other = Player.objects.create(opponent_kind_id='h')
+        self.save(self.player, {0: 1})
+        self.add_question()
+        self.save(other, {0: 2, 8: 0})
+        questions = get_questionnaire().questions
+        self.assertNotEqual(AnswerSheet.objects.get(player=self.player).version_id,
+                            AnswerSheet.objects.get(player=other).version_id)
+        self.assertEqual(answers.get_answers([self.player.id, other.id]), {
+            self.player.id: {questions[0].id: questions[0].options[1][0]},
+            other.id: {questions[0].id: questions[0].options[2][0],
+                       questions[8].id: questions[8].options[0][0]},
+        })
+
+    def test_convert_rows(self):
+        other = Player.objects.create(opponent_kind_id='h')
+        self.save(self.player, {0: 1, 1: 0})
+        self.save(other, {0: 2})
+        question = Question.objects.create(text='Another question')
+        option = Option.objects.create(question=question, text='Yes')
+        # Not in the questionnaire yet: that's only reloaded after the request.
+        Answer.objects.create(player=other, question=question, option=option)
+        before = answers.get_answers([self.player.id, other.id])
+        self.assertEqual(answers.convert_rows(), (1, [other.id]))
+        self.assertEqual(AnswerSheet.objects.get(player=self.player).answers, '10------')
+        self.assertFalse(Answer.objects.filter(player=self.player).exists())
+        self.assertEqual(Answer.objects.filter(player=other).count(), 2)
+        self.assertEqual(answers.get_answers([self.player.id, other.id]), before)
+
+class ReaperTest(TestCase):
+    def setUp(self):
+        setup_game()
+        self.old = timezone.now() - timedelta(days=3)
+
+    def add_player(self, rounds_played=0, registered=None, **kwargs):
+        player = Player.objects.create(opponent_kind=allocation.allocate_kind(),
+                                       rounds_played=rounds_played, **kwargs)
+        Player.objects.filter(id=player.id).update(registration_datetime=registered or self.old)
+        return player
+
+    def counts(self):
+        return (dict(KindCounter.objects.values_list('kind', 'num_players')),
+                dict(Kind.objects.annotate(num_players=Count('player')).values_list(
+                    'id', 'num_players')))
+
+    def test_reap_players(self):
+        abandoned = [self.add_player() for i in range(5)]
+        partial = self.add_player(rounds_played=3)
+        recent = self.add_player(registered=timezone.now())
+        finished = self.add_player(rounds_played=8, mturk_key=uuid1().hex)
+        before = self.counts()[0]
+        deleted = reaper.reap_players(batch_size=2)
+        self.assertEqual(sum(deleted.values()), 5)
+        self.assertEqual(set(Player.objects.values_list('id', flat=True)),
+                         set([partial.id, recent.id, finished.id]))
+        counters, players = self.counts()
+        self.assertEqual(counters, dict((k, n - deleted.get(k, 0)) for k, n in before.items()))
+        # prefer_kind() counted one player for every kind but one.
+        self.assertEqual(counters, dict((k, n + (k != 'h')) for k, n in players.items()))
+
+        self.assertEqual(sum(reaper.reap_players(include_partial=True).values()), 1)
+        self.assertEqual(Player.objects.count(), 2)
+
+    def test_reap_sessions(self):
+        for expired in (True, True, True, False):
+            Session.objects.create(session_key=uuid1().hex, session_data='',
+                                   expire_date=timezone.now() + timedelta(days=-1 if expired else 1))
+        self.assertEqual(reaper.reap_sessions(batch_size=2), 3)
+        self.assertEqual(Session.objects.count(), 1)
+
+class ArchiveTest(ArchivesTestCase):
+    def setUp(self):
+        super(ArchiveTest, self).setUp()
+        setup_game()
+        self.players = [add_finished_player(kind_id) for kind_id in 'hcr']
+        self.unfinished = Player.objects.create(opponent_kind_id='h')
+
+    def export(self):
+        f = StringIO()
+        export.export_csv(f)
+        return f.getvalue()
+
+    def test_archive(self):
+        exported = self.export()
+        registered = dict(Player.objects.values_list('id', 'registration_datetime'))
+        rates = analysis.acceptance_rates(analysis.load_rounds(), seed=1)
+        scores = analysis.questionnaire_scores(analysis.load_answers())[1]
+
+        self.assertEqual(archive.archive_wave('wave1'), 3)
+        self.assertEqual(list(Player.objects.values_list('id', flat=True)), [self.unfinished.id])
+        self.assertFalse(Round.objects.exists() or Answer.objects.exists())
+        alias = archive.get_alias('wave1')
+        self.assertEqual(Round.objects.using(alias).count(), 24)
+        for player_id, registration_datetime in Player.objects.using(alias).values_list(
+                'id', 'registration_datetime'):
+            self.assertEqual(registration_datetime, registered[player_id])
+        # Exports and analyses read the archive along with the live database.
+        self.assertEqual(self.export(), exported)
+        self.assertEqual(analysis.acceptance_rates(analysis.load_rounds(), seed=1), rates)
+        self.assertEqual(analysis.questionnaire_scores(analysis.load_answers())[1].tolist(),
+                         scores.tolist())
+
+        # The next wave is added to its own archive.
+        player = add_finished_player('n')
+        self.assertEqual(archive.archive_wave('wave2'), 1)
+        self.assertEqual(archive.list_archives(), ['wave1', 'wave2'])
+        header, rows = read_csv(self.export())
+        self.assertEqual(len(rows), 32)
+        self.assertEqual(int(rows[-1][0]), player.id)
+
+    def test_interrupted(self):
+        alias = archive.create_archive('wave1')
+        archive.copy_reference_rows(alias)
+        # Copied, but not yet deleted.
+        ids = [p.id for p in self.players]
+        for model, field in archive.PLAYER_MODELS:
+            archive.copy_rows(alias, model, list(model.objects.filter(**{field + '__in': ids})))
+        self.assertEqual(archive.archive_wave('wave1'), 3)
+        self.assertEqual(Player.objects.using(alias).count(), 3)
+        self.assertEqual(Player.objects.count(), 1)
+
+    def test_reused_id(self):
+        archive.archive_wave('wave1')
+        # The database handed out the id of an archived player again.
+        player = self.players[-1]
+        Player.objects.create(id=player.id, opponent_kind_id='h', mturk_key=uuid1().hex)
+        self.assertRaises(archive.ArchiveError, archive.archive_wave, 'wave1')
+        self.assertTrue(Player.objects.filter(id=player.id).exists())
+        self.assertEqual(Player.objects.using(archive.get_alias('wave1')).get(
+            id=player.id).mturk_key, player.mturk_key)
+
+class ReplicaTest(TestCase):
+    def tearDown(self):
+        if replica.has_replica():
+            connections[replica.REPLICA].close()
+            del connections.databases[replica.REPLICA]
+
+    def add_replica(self):
+        connections.databases[replica.REPLICA] = {'ENGINE': 'django.db.backends.sqlite3',
+                                                  'NAME': ':memory:'}
+
+    def test_without_replica(self):
+        with replica.replica_reads():
+            self.assertEqual(Player.objects.all().db, 'default')
+            self.assertEqual(replica.get_lag(), timedelta(0))
+
+    def test_routing(self):
+        self.add_replica()
+        self.assertEqual(Player.objects.all().db, 'default')
+        with replica.replica_reads():
+            self.assertEqual(Player.objects.all().db, replica.REPLICA)
+            self.assertEqual(router.db_for_write(Player), 'default')
+            self.assertEqual(replica.get_lag(), replica.MAX_LAG)
+            player = Player(opponent_kind_id='h')
+            player._state.db = replica.REPLICA
+            self.assertEqual(router.db_for_write(Player, instance=player), 'default')
+            # Instances read from an archive stay there.
+            player._state.db = archive.get_alias('wave1')
+            self.assertEqual(router.db_for_read(Player, instance=player), player._state.db)
+        self.assertEqual(Player.objects.all().db, 'default')
+        self.assertFalse(router.allow_syncdb(replica.REPLICA, Player))
+
+    def test_use_replica(self):
+        self.add_replica()
+        view = replica.use_replica(lambda: Player.objects.all().db)
+        self.assertEqual(view(), replica.REPLICA)
+        self.assertEqual(Player.objects.all().db, 'default')
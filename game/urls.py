@@ -13,5 +13,7 @@ urlpatterns = patterns(#'',
     url(r'^questionnaire/$', views.questionnaire, name='questionnaire'),
     url(r'^demographic/$', views.demographic, name='demographic'),
     url(r'^thankyou/$', views.thankyou, name='thankyou'),
+    url(r'^dashboard/$', views.dashboard, name='dashboard'),
+    url(r'^metrics/$', views.metrics_endpoint, name='metrics'),
     url('', views.start_game, name='start_game')    
 )
@@ -1,15 +1,26 @@
 import logging
-import random
 import time
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Min
-from django.http import HttpResponseNotAllowed, HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseRedirect
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.views.decorators.http import require_http_methods, require_GET, require_POST
-from django.core.paginator import Paginator, PageNotAnInteger
 
-from game.models import Kind, Opponent, Player, Round, Question, Option, Answer
+from game import metrics, summary
+from game.answers import save_answers
+from game.allocation import allocate_kind
+from game.flow import get_flow_state
+from game.pages import render_cached
+from game.replica import use_replica
+from game.models import Kind, KindCounter, Opponent, Player, Round
+from game.questionnaire import get_questionnaire
+from game.schedules import Schedule, generate_schedule
 from game.forms import OfferAcceptanceForm, QuestionnaireForm, ReadForm, DemographicForm
 
 from uuid import uuid1
@@ -18,10 +29,6 @@ from uuid import uuid1
 AMOUNT_AVAILABLE = 100
 # The number of rounds.
 NUM_ROUNDS = 8
-# The number of questions per page in the questionnaire.
-QUESTIONS_PER_PAGE = 5
-# The minimum number of questions per page in the questionnaire.
-QUESTION_ORPHANS = 2
 
 logger = logging.getLogger(__name__)
 
@@ -50,12 +57,73 @@ logger = logging.getLogger(__name__)
 class HttpResponseSeeOther(HttpResponseRedirect):
     status_code = 303
 
-def get_or_create_player(session):
-    player, created = Player.objects.get_or_create(id=session.get('player_id', None),
-        defaults={'opponent_kind': select_opponent_kind_for_new_player()})
-
-    if created:
-        session['player_id'] = player.id
+class RoundState(object):
+    """A player's progress through the game, as seen by a single request.
+
+    Every game view needs (part of) the same data: the player (including its
+    progress counter and schedule) and its opponent kind, and the current
+    opponent. RoundState loads each of these lazily and at most once, so that
+    all helpers below can share them instead of querying the same rows over
+    and over again.
+    """
+
+    def __init__(self, flow):
+        self.flow = flow
+
+    @cached_property
+    def player(self):
+        return get_or_create_player(self.flow)
+
+    @cached_property
+    def schedule(self):
+        player = self.player
+        if not player.schedule:
+            # Players that registered before schedules were introduced.
+            player.schedule = create_schedule(player.opponent_kind).encode()
+            player.save(update_fields=['schedule'])
+        return Schedule.decode(player.schedule)
+
+    @cached_property
+    def opponent(self):
+        # XXX: Use hasattr or something like that instead? If so, fix
+        # elsewhere as well.
+        opponent_id = self.flow.get('opponent_id', None)
+        if not opponent_id:
+            return None
+        opponent = Opponent.objects.get(id=opponent_id)
+        # Spare the lookup of the kind we already have.
+        opponent.kind = self.player.opponent_kind
+        return opponent
+
+    def set_opponent(self, opponent_id):
+        self.flow['opponent_id'] = opponent_id
+        self.__dict__.pop('opponent', None)
+
+    def get_round(self, opponent):
+        """Return the round played against the given opponent, if any."""
+        try:
+            return Round.objects.get(player=self.player, opponent=opponent)
+        except Round.DoesNotExist:
+            return None
+
+def get_round_state(request):
+    """Return the RoundState shared by all helpers handling this request."""
+    if not hasattr(request, 'round_state'):
+        request.round_state = RoundState(get_flow_state(request))
+    return request.round_state
+
+def get_or_create_player(flow):
+    player_id = flow.get('player_id', None)
+    if player_id:
+        try:
+            return Player.objects.select_related('opponent_kind').get(id=player_id)
+        except Player.DoesNotExist:
+            pass
+
+    kind = select_opponent_kind_for_new_player()
+    player = Player.objects.create(opponent_kind=kind,
+                                   schedule=create_schedule(kind).encode())
+    flow['player_id'] = player.id
 
     return player
 
@@ -68,170 +136,143 @@ def select_opponent_kind_for_new_player():
     # round data into account is that it has nicer characteristics if, after
     # _some_ rounds have already been played, a large number of people all of a
     # sudden start the experiment.
-    kinds = Kind.objects.annotate(num_players=Count('player'))
-    min_players = kinds.aggregate(min_players=Min('num_players'))['min_players']
-    return random.choice(kinds.filter(num_players=min_players))
+    return allocate_kind()
 
-def get_opponent(session):
-    # XXX: Use hasattr or something like that instead? If so, fix elsewhere as
-    # well.
-    opponent_id = session.get('opponent_id', None)
-    return Opponent.objects.get(id=opponent_id) if opponent_id else None
+def create_schedule(kind):
+    opponent_ids = list(Opponent.objects.filter(kind=kind).values_list('id', flat=True))
+    # XXX: The number of opponents of any given kind must match the number of
+    # rounds. That correspondence must be made clearer!
+    assert len(opponent_ids) == NUM_ROUNDS
+    return generate_schedule(kind, opponent_ids)
 
-def create_opponent(session, player):
-    # Must not have more than one opponent concurrently.
-    assert not get_opponent(session)
+def get_opponent(state):
+    return state.opponent
 
-    # Determine eligible opponents.
-    available_opponents = list(Opponent.objects.filter(kind=player.opponent_kind))
-    for r in Round.objects.filter(player=player):
-        # Can't play the same opponent twice.
-        available_opponents.remove(r.opponent)
+def create_opponent(state):
+    # Must not have more than one opponent concurrently.
+    assert not get_opponent(state)
 
-    if not available_opponents:
+    played = state.player.rounds_played
+    if played >= len(state.schedule):
         # No opponents left.
         return None
 
-    # XXX: Might have to select a RANDOM opponent; see
-    # /opt/lampp/htdocs/ultimatum/index.php
-    opponent = random.choice(available_opponents)
-    session['opponent_id'] = opponent.id
-
-    return opponent
-
-def create_intent(session, player):
-    choice = session.get('intent', random.choice([True, False]))
-    session['intent'] = choice
-
-    return choice
-
-def get_or_create_offer(session, player, opponent):
-    offer = session.get('amount_offered', None)
-    if offer:
-        # Already made an offer, but it was not yet accepted.
-        return offer
-
-    # XXX: This amount precisely matches the number of opponents of any given
-    # kind. That correspondence must be made clearer!
-    # XXX: Also, for some reason an offer of 40 was never made. We could easily
-    # add two times 40. As long as the number of available options is equal to
-    # or greater than the number of available opponents, there's no problem.
-    # (Of course, during statistical analysis one must keep in mind that
-    # players did not receive exactly the same offers.)
-    if str(opponent.kind) != 'Randomness':
-        available_offers = [10, 20, 30, 50]
-        assert len(available_offers) * 2 == NUM_ROUNDS
-    else:
-        available_offers = [10, 10, 20, 20, 30, 30, 50, 50]
-        assert len(available_offers)  == NUM_ROUNDS
-        session['intent'] = False
-        
-    for r in Round.objects.filter(player=player, is_intentional=session['intent']):
-        available_offers.remove(r.amount_offered)
+    # The schedule never lists the same opponent twice.
+    state.set_opponent(state.schedule.opponents[played])
 
+    return get_opponent(state)
 
-    # XXX make nicer.
-    assert available_offers
+def get_next_picture(state):
+    """Return the picture of the opponent of the next round, if any."""
+    played = state.player.rounds_played
+    if played >= len(state.schedule):
+        return None
+    picture = Opponent.objects.values_list('picture', flat=True).get(
+        id=state.schedule.opponents[played])
+    return picture + '.jpg'
 
-    # XXX: The original experiment hard-coded eight distinct offer sequences
-    # that were "symmetric". The fourth and fifth offer would always be
-    # identical. Our randomized appraoch doesn't guarantee any of these
-    # properties. Is that a good or a bad thing?
-    offer = random.choice(available_offers)
-    session['amount_offered'] = offer
+def get_intent(state, round_number):
+    return state.schedule.intents[round_number - 1]
 
-    return offer
+def get_offer(state, round_number):
+    return state.schedule.offers[round_number - 1]
 
-def get_round_number(session, player):
+def get_round_number(state):
     # Must have an opponent for this question to make sense.
-    assert get_opponent(session)
+    assert get_opponent(state)
 
-    return len(Round.objects.filter(player=player)) + 1
+    return state.player.rounds_played + 1
 
-def get_round_details(session, find_opponent=False):
-    player = get_or_create_player(session)
+def get_round_details(state, find_opponent=False):
+    player = state.player
 
-    opponent = get_opponent(session)
+    opponent = get_opponent(state)
     if not opponent and find_opponent:
-        opponent = create_opponent(session, player)
+        opponent = create_opponent(state)
 
     if opponent:
-        round_number = get_round_number(session, player)
-        logger.debug('Player %s plays round %d against %s' %
-                     (player, round_number, opponent))
+        round_number = get_round_number(state)
+        logger.debug('Player %s plays round %d against %s',
+                     player, round_number, opponent)
     else:
         round_number = None
-        logger.debug('Player %s played all rounds' % player)
+        logger.debug('Player %s played all rounds', player)
 
     return player, opponent, round_number
 
+@transaction.commit_on_success
+def save_round(form):
+    round = form.save()
+    round.player.record_round(round)
+    summary.record_round(round.player, round)
+    return round
+
 def is_first_subround(round_number):
     return round_number in {1, (NUM_ROUNDS / 2) + 1}
 
 @require_GET
 def start_game(request):
-    request.session['start_time'] = time.time()
-    return render(request, 'game/start_game.html', {})
+    flow = get_flow_state(request)
+    if 'start_time' not in flow:
+        summary.increment(summary.STARTED)
+    flow['start_time'] = time.time()
+    return render_cached(request, 'game/start_game.html')
 
 @require_GET
 def view_instructions(request):
-    player = get_or_create_player(request.session)
+    flow = get_flow_state(request)
+    player = get_round_state(request).player
     
     if player.instructions_time == -1:
-        elapsed = (time.time() - request.session.get('start_time')) * 1000
+        if player.start_time == -1:
+            summary.increment(summary.INSTRUCTIONS)
+        elapsed = (time.time() - flow.get('start_time')) * 1000
         player.start_time = int(round(elapsed))
-        player.save()
+        player.save(update_fields=['start_time'])
 
-    request.session['instructions_time'] = time.time()
+    flow['instructions_time'] = time.time()
 
     if str(player.opponent_kind) == 'Randomness':
         page = 'game:no_player'
     else:
         page = 'game:intentionality'
 
-    return render(request, 'game/view_instructions.html',
-                  {'opponent_kind': str(player.opponent_kind),
-                    'page' : page})
+    return render_cached(request, 'game/view_instructions.html', player.opponent_kind_id,
+                         {'opponent_kind': str(player.opponent_kind),
+                          'page' : page})
 @require_GET
 def no_player(request):
-    return render(request, 'game/no_player.html', {})
+    return render_cached(request, 'game/no_player.html')
 
 @require_http_methods(["GET", "POST"])
 def intentionality(request):
-    player, opponent, round_number = get_round_details(request.session)
+    state = get_round_state(request)
+    player, opponent, round_number = get_round_details(state)
     
     form = ReadForm()
     logger.debug(request.POST.get('checked', False))
     if not is_first_subround(round_number):
         return HttpResponseSeeOther(reverse('game:start_round'))
 
-    if 'viewed_intentionality' not in request.session:
-        request.session['viewed_intentionality'] = []
-
     if request.method == 'POST' and request.POST.get('checked', False):
-        request.session['viewed_intentionality'] += [round_number]
+        state.flow['viewed_intentionality'] = (state.flow.get('viewed_intentionality', []) +
+                                               [round_number])
         return HttpResponseSeeOther(reverse('game:start_round'))
     
-    choice = create_intent(request.session, player)
-    
-    if (round_number != 1):
-        visited_intent = request.session.get('visited_intent', False)
-        if not visited_intent:
-            choice = not choice
-            request.session['intent'] = choice
-            request.session['visited_intent'] = True
-    
-    return render(request, 'game/intentionality.html',
-                  {'intentionality': choice, 'form': form})
+    choice = get_intent(state, round_number)
+
+    return render_cached(request, 'game/intentionality.html', choice,
+                         {'intentionality': choice, 'form': form})
 
 @require_GET
 def start_round(request):
-    player, opponent, round_number = get_round_details(request.session, True)
+    state = get_round_state(request)
+    player, opponent, round_number = get_round_details(state, True)
 
     if player.instructions_time == -1:
-        elapsed = (time.time() - request.session.get('instructions_time')) * 1000
+        elapsed = (time.time() - state.flow.get('instructions_time')) * 1000
         player.instructions_time = int(round(elapsed))
-        player.save()
+        player.save(update_fields=['instructions_time'])
     #if round_number in {1, (NUM_ROUNDS/2)+1} and not request.session.get('viewed', False):
     #    request.session['viewed'] = True
     #    return HttpResponseSeeOther(reverse('game:intentionality'))
@@ -241,7 +282,7 @@ def start_round(request):
     if not opponent:
         return HttpResponseSeeOther(reverse('game:questionnaire'))
          
-    if is_first_subround(round_number) and not round_number in request.session.get('viewed_intentionality', []) and not str(opponent.kind) == 'Randomness':
+    if is_first_subround(round_number) and not round_number in state.flow.get('viewed_intentionality', []) and not opponent.kind_id == Kind.ID_NONDETERMINISTIC:
         return HttpResponseSeeOther(reverse('game:intentionality'))
 
     return render(request, 'game/start_round.html',
@@ -249,24 +290,31 @@ def start_round(request):
 
 @require_http_methods(["GET", "POST"])
 def play_round(request):
-    player, opponent, round_number = get_round_details(request.session)
+    state = get_round_state(request)
+    player, opponent, round_number = get_round_details(state)
     if not opponent:
         # The player has not yet been introduced to an opponent. That must
         # happen first.
         return HttpResponseSeeOther(reverse('game:start_round'))
+    if state.get_round(opponent) is not None:
+        # Already played, e.g. the form was submitted twice. rounds_played
+        # already counts this round, so round_number is the next one's.
+        return HttpResponseSeeOther(reverse('game:end_round'))
 
-    amount_offered = get_or_create_offer(request.session, player, opponent)
+    amount_offered = get_offer(state, round_number)
     round = Round(player=player, opponent=opponent, amount_offered=amount_offered,
-                  is_intentional=(request.session['intent']))
+                  is_intentional=get_intent(state, round_number))
     if request.method == 'GET':
         form = OfferAcceptanceForm(instance=round)
     else:
         form = OfferAcceptanceForm(request.POST, instance=round)
         if form.is_valid():
-            form.save()
-            # Abstract away from this.
-            del request.session['amount_offered']
-            #del request.session['opponent_id']
+            try:
+                save_round(form)
+            except IntegrityError:
+                # Saved by a concurrent submission of the same form.
+                pass
+            #del state.flow['opponent_id']
 
             return HttpResponseSeeOther(reverse('game:end_round'))
 
@@ -282,62 +330,63 @@ def play_round(request):
 
 @require_GET
 def end_round(request):
-    player, opponent, round_number = get_round_details(request.session)
-    round = Round.objects.get(player=player, opponent=opponent)
-    logger.debug('offered: %s, accepted: %s' % (str(round.amount_offered), str(round.accepted)))
-    del request.session['opponent_id']
-    return render(request, 'game/end_round.html', {'amount_offered': round.amount_offered, 'accepted': round.accepted})
+    state = get_round_state(request)
+    player, opponent, round_number = get_round_details(state)
+    round = state.get_round(opponent)
+    if round is None:
+        raise Round.DoesNotExist('%s has not played against %s' % (player, opponent))
+    logger.debug('offered: %s, accepted: %s', round.amount_offered, round.accepted)
+    del state.flow['opponent_id']
+    # Let the browser fetch the next opponent's picture while the player reads.
+    return render(request, 'game/end_round.html', {'amount_offered': round.amount_offered, 'accepted': round.accepted,
+                                                   'next_picture': get_next_picture(state)})
 
 @require_http_methods(["GET", "POST"])
 def questionnaire(request):
-    player = get_round_details(request.session)[0]
-    questions = Question.objects.all()
+    flow = get_flow_state(request)
+    player = get_round_details(get_round_state(request))[0]
+    questionnaire = get_questionnaire()
+    page = flow.get('page', 1)
     
-    paginator = Paginator(questions, per_page=QUESTIONS_PER_PAGE, orphans=QUESTION_ORPHANS) # Show x questions per page
-    page = request.session.get('page', 1)
-    
-    if page > paginator.num_pages:
+    if page > questionnaire.num_pages:
         return HttpResponseSeeOther(reverse('game:demographic'))
     
     if page == 1:
-        request.session['questionnaire_time'] = time.time()
+        flow['questionnaire_time'] = time.time()
     
-    questions = paginator.page(page)
-    answers = [Answer(player=player, question=q) for q in questions]
+    questions = questionnaire.page(page)
     if request.method == 'GET':
-        forms = [QuestionnaireForm(prefix=str(a.question.id), instance=a) for a in answers]
-        questions_forms = [(a.question, QuestionnaireForm(prefix=str(a.question.id), instance=a)) for a in answers]
+        forms = [QuestionnaireForm(q, prefix=str(q.id)) for q in questions]
     else:
-        forms = [QuestionnaireForm(request.POST, prefix=str(a.question.id), instance=a) for a in answers]
-        questions_forms = [(a.question, QuestionnaireForm(request.POST, prefix=str(a.question.id), instance=a)) for a in answers]
+        forms = [QuestionnaireForm(q, request.POST, prefix=str(q.id)) for q in questions]
         if all([form.is_valid() for form in forms]):
-            for form in forms:
-                form.save()
+            try:
+                save_answers(player, [form.get_answer(player) for form in forms])
+            except IntegrityError:
+                # Saved by a concurrent submission of the same page.
+                pass
             page += 1
-            request.session['page'] = page
+            flow['page'] = page
             if not questions.has_next():
                 # Last page. Go to next page.
-                request.session['finished'] = True
+                flow['finished'] = True
                 if player.questionnaire_time == -1:
-                    elapsed = (time.time() - request.session.get('questionnaire_time')) * 1000
+                    summary.increment(summary.QUESTIONNAIRE)
+                    elapsed = (time.time() - flow.get('questionnaire_time')) * 1000
                     player.questionnaire_time = int(round(elapsed))
-                    player.save()
+                    player.save(update_fields=['questionnaire_time'])
                 return HttpResponseSeeOther(reverse('game:demographic'))
             else:
                 return HttpResponseSeeOther(reverse('game:questionnaire'))
     
-    questions = paginator.page(page)
-    
-    for (question, form) in questions_forms:
-        form.fields['option'].queryset = Option.objects.filter(question=question)
-        form.fields['option'].empty_label = None
+    questions_forms = [(form.question, form) for form in forms]
     
-    request.session['page'] = page
+    flow['page'] = page
     return render(request, 'game/questionnaire.html', {'forms': forms, 'questions_forms': questions_forms})
 
 @require_http_methods(["GET", "POST"])
 def demographic(request):
-    player, opponent, round_number = get_round_details(request.session)
+    player, opponent, round_number = get_round_details(get_round_state(request))
     if request.method == 'GET':
         form = DemographicForm(instance=player)
     else:
@@ -349,9 +398,48 @@ def demographic(request):
 
 @require_GET
 def thankyou(request):
-    player, opponent, round_number = get_round_details(request.session)
+    player, opponent, round_number = get_round_details(get_round_state(request))
     if player.mturk_key == str(0):
         player.mturk_key = uuid1().hex
-        player.save()
+        player.finished_datetime = timezone.now()
+        player.save(update_fields=['mturk_key', 'finished_datetime'])
+        summary.increment(summary.THANKYOU)
     key = player.mturk_key
     return render(request, 'game/thankyou.html', {'key': key})
+
+@staff_member_required
+@require_GET
+@use_replica
+def dashboard(request):
+    counters = summary.get_counters()
+    kinds = dict(KindCounter.objects.values_list('kind', 'num_players'))
+
+    stages = [('Started', summary.STARTED), ('Instructions', summary.INSTRUCTIONS)]
+    stages += [('Round %d' % n, summary.round_stage(n)) for n in range(1, NUM_ROUNDS + 1)]
+    stages += [('Questionnaire', summary.QUESTIONNAIRE), ('Thank you', summary.THANKYOU)]
+
+    offers = []
+    for kind_id, kind_name in Kind.IDS:
+        for amount in sorted(set(int(name.split(':')[2]) for name in counters
+                                 if name.startswith('offer:%s:' % kind_id))):
+            for intentional in (True, False):
+                accepted = counters.get(summary.offer_outcome(kind_id, amount, intentional, True), 0)
+                rejected = counters.get(summary.offer_outcome(kind_id, amount, intentional, False), 0)
+                if accepted or rejected:
+                    offers.append({'kind': kind_name, 'amount_offered': amount,
+                                   'is_intentional': intentional,
+                                   'accepted': accepted, 'rejected': rejected})
+
+    return render(request, 'game/dashboard.html', {
+        'kinds': [(name, kinds.get(kind_id, 0)) for kind_id, name in Kind.IDS],
+        'stages': [(label, counters.get(name, 0)) for label, name in stages],
+        'offers': offers,
+    })
+
+@require_GET
+def metrics_endpoint(request):
+    """The request metrics of this process (see game.metrics), for Prometheus.
+    Only available to INTERNAL_IPS and staff members."""
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4')
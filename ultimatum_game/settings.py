@@ -1,4 +1,7 @@
 # Django settings for ultimatum_game project.
+import os
+
+from django.core.exceptions import ImproperlyConfigured
 
 DEBUG = True
 TEMPLATE_DEBUG = DEBUG
@@ -18,8 +21,26 @@ DATABASES = {
         'PASSWORD': 'root',
         'HOST': '',                      # Empty for localhost through domain sockets or '127.0.0.1' for localhost through TCP.
         'PORT': '',                      # Set to empty string for default.
-    }
+    },
+    # A read-only replica of 'default' (e.g. a MySQL slave), for the export,
+    # the analysis, the dashboard and the admin's lists. See game/replica.py.
+    #'replica': {
+    #    'ENGINE': 'django.db.backends.mysql',
+    #    'NAME': 'hti',
+    #    'USER': 'root',
+    #    'PASSWORD': 'root',
+    #    'HOST': 'replica.example.com',
+    #    'PORT': '',
+    #},
 }
+DATABASE_ROUTERS = ['game.replica.ReplicaRouter']
+# How long (in seconds) a database connection is kept open for further
+# requests: 0 closes it after every request, None keeps it open for good. Keep
+# it below MySQL's wait_timeout. See game/persistent.py.
+GAME_DB_CONN_MAX_AGE = 600
+# The alias of the replica, and how far (in seconds) it lags behind at most.
+GAME_REPLICA_DATABASE = 'replica'
+GAME_REPLICA_MAX_LAG = 60
 
 # Hosts/domain names that are valid for this site; required if DEBUG is False
 # See https://docs.djangoproject.com/en/1.5/ref/settings/#allowed-hosts
@@ -82,8 +103,11 @@ STATICFILES_FINDERS = (
 #    'django.contrib.staticfiles.finders.DefaultStorageFinder',
 )
 
-# Make this unique, and don't share it with anybody.
-SECRET_KEY = 'wtk-&yn=qg+4ovh1=&*@*wb$ou36_exb=@10i9&sc4ekvtuvp7'
+# Make this unique, and don't share it with anybody. The key below is in the
+# repository, so for a study set ULTIMATUM_GAME_SECRET_KEY in the environment
+# of the server instead.
+SECRET_KEY = os.environ.get('ULTIMATUM_GAME_SECRET_KEY',
+                            'wtk-&yn=qg+4ovh1=&*@*wb$ou36_exb=@10i9&sc4ekvtuvp7')
 
 # List of callables that know how to import templates from various sources.
 TEMPLATE_LOADERS = (
@@ -92,7 +116,18 @@ TEMPLATE_LOADERS = (
 #     'django.template.loaders.eggs.Loader',
 )
 
+# In production, parse and compile each template only once per process.
+if not DEBUG:
+    TEMPLATE_LOADERS = (
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    )
+
 MIDDLEWARE_CLASSES = (
+    # First, so that it measures everything the other middleware does.
+    'game.metrics.MetricsMiddleware',
+    # Keeps the database connections open between requests; see
+    # GAME_DB_CONN_MAX_AGE below.
+    'game.persistent.PersistentConnectionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -126,6 +161,53 @@ INSTALLED_APPS = (
 
 SESSION_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
 
+# Sessions are kept in the database and read through the cache below (the
+# local-memory cache is per process, so with more than one server process use
+# the file-based cache, or memcached, instead). The game keeps its state in the
+# session as a single small record (see game/flow.py), so they could also be
+# kept in signed cookies, which costs no queries at all. But anyone who knows
+# SECRET_KEY can then forge any participant's session, so that requires
+# ULTIMATUM_GAME_SECRET_KEY.
+GAME_SIGNED_COOKIE_SESSIONS = False
+if GAME_SIGNED_COOKIE_SESSIONS:
+    if 'ULTIMATUM_GAME_SECRET_KEY' not in os.environ:
+        raise ImproperlyConfigured('GAME_SIGNED_COOKIE_SESSIONS requires a secret key '
+                                   'in ULTIMATUM_GAME_SECRET_KEY.')
+    SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_COOKIE_HTTPONLY = True
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    #'default': {
+    #    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    #    'LOCATION': '/var/tmp/ultimatum_game_cache',
+    #},
+}
+
+# The fraction of requests measured by game.metrics.MetricsMiddleware, and the
+# interval (in seconds) between the summaries it logs. The metrics can be
+# scraped from /game/metrics/ by INTERNAL_IPS.
+GAME_METRICS_SAMPLE_RATE = 1.0
+GAME_METRICS_LOG_INTERVAL = 60
+INTERNAL_IPS = ('127.0.0.1',)
+
+# How answers to the questionnaire are stored: 'rows' (one Answer per question)
+# or 'sheets' (one compact AnswerSheet per player). See game/answers.py.
+GAME_ANSWER_STORAGE = 'rows'
+
+# The directory holding the archives of completed waves (see game/archive.py);
+# by default, archives/ next to manage.py. Use an absolute path.
+#GAME_ARCHIVE_DIR = '/var/lib/ultimatum_game/archives'
+
+# The strategy that draws up the opponents, offers and intents of a new player.
+# Use 'game.schedules.SymmetricScheduleGenerator' for the symmetric offer
+# sequences of the original experiment.
+GAME_SCHEDULE_GENERATOR = 'game.schedules.RandomScheduleGenerator'
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
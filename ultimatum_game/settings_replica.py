@@ -0,0 +1,15 @@
+# Settings for trying out replica reads (see game/replica.py) locally, with two
+# SQLite databases: run python manage.py copy_replica to bring the replica up to
+# date. Use with: python manage.py <command> --settings=ultimatum_game.settings_replica
+from ultimatum_game.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'hti.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'hti_replica.sqlite3',
+    },
+}
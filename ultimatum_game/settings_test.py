@@ -0,0 +1,14 @@
+# Settings for running the tests without a MySQL server, with:
+# python manage.py test game --settings=ultimatum_game.settings_test
+# The test database is a SQLite file rather than an in-memory database, which
+# every thread would get a fresh copy of, so that the tests of concurrent
+# requests run too.
+from ultimatum_game.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'hti.sqlite3',
+        'TEST_NAME': 'test_hti.sqlite3',
+    },
+}
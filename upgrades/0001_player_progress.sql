@@ -0,0 +1,11 @@
+-- Adds the per-player progress counter (Player.rounds_played) to an existing
+-- database and fills it in from the rounds played so far.
+--
+-- Usage: mysql -u root -p hti < upgrades/0001_player_progress.sql
+
+ALTER TABLE game_player
+    ADD COLUMN rounds_played integer NOT NULL DEFAULT 0;
+
+UPDATE game_player p SET
+    rounds_played = (SELECT COUNT(*) FROM game_round r
+                     WHERE r.player_id = p.id);
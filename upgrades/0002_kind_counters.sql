@@ -0,0 +1,15 @@
+-- Adds the KindCounter table used by game.allocation and fills it in from the
+-- players assigned so far. (If this script is skipped, game.allocation creates
+-- the counters itself on the first registration.)
+--
+-- Usage: mysql -u root -p hti < upgrades/0002_kind_counters.sql
+
+CREATE TABLE game_kindcounter (
+    kind_id varchar(1) NOT NULL PRIMARY KEY,
+    num_players integer NOT NULL,
+    FOREIGN KEY (kind_id) REFERENCES game_kind (id)
+);
+
+INSERT INTO game_kindcounter (kind_id, num_players)
+    SELECT k.id, (SELECT COUNT(*) FROM game_player p WHERE p.opponent_kind_id = k.id)
+    FROM game_kind k;
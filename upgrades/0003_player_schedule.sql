@@ -0,0 +1,9 @@
+-- Adds Player.schedule. Players registered before this upgrade get a schedule
+-- the next time they visit a game page. Apply it between study waves: a schedule
+-- drawn up for a player that is halfway through the game does not take the
+-- rounds already played into account.
+--
+-- Usage: mysql -u root -p hti < upgrades/0003_player_schedule.sql
+
+ALTER TABLE game_player
+    ADD COLUMN schedule varchar(100) NOT NULL DEFAULT '';
@@ -0,0 +1,12 @@
+-- Makes sure a player answers every question at most once. Duplicate answers
+-- (left behind by pages that were submitted twice) are removed first; the
+-- latest answer is kept.
+--
+-- Usage: mysql -u root -p hti < upgrades/0004_unique_answers.sql
+
+DELETE a FROM game_answer a
+    JOIN game_answer b
+      ON a.player_id = b.player_id AND a.question_id = b.question_id AND a.id < b.id;
+
+ALTER TABLE game_answer
+    ADD UNIQUE INDEX game_answer_player_id_question_id (player_id, question_id);
@@ -0,0 +1,8 @@
+-- Adds Player.finished_datetime, used by incremental exports. Players that
+-- finished before this upgrade keep NULL and are only included in full exports.
+--
+-- Usage: mysql -u root -p hti < upgrades/0005_player_finished_datetime.sql
+
+ALTER TABLE game_player
+    ADD COLUMN finished_datetime datetime NULL,
+    ADD INDEX game_player_finished_datetime (finished_datetime);
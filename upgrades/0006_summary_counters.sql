@@ -0,0 +1,9 @@
+-- Adds the SummaryCounter table behind the dashboard. Afterwards, fill it in
+-- from the participants so far by running: python manage.py rebuild_summary
+--
+-- Usage: mysql -u root -p hti < upgrades/0006_summary_counters.sql
+
+CREATE TABLE game_summarycounter (
+    name varchar(50) NOT NULL PRIMARY KEY,
+    value integer NOT NULL
+);
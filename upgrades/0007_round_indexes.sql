@@ -0,0 +1,16 @@
+-- Adds the composite indexes of Round: a unique one on (player, opponent) and
+-- one on (player, is_intentional).
+--
+-- A player should never have played the same opponent twice. If the ALTER
+-- below fails on a duplicate key, list the offending rounds with
+--
+--   SELECT player_id, opponent_id, COUNT(*) FROM game_round
+--   GROUP BY player_id, opponent_id HAVING COUNT(*) > 1;
+--
+-- and decide which of them to keep before running this script again.
+--
+-- Usage: mysql -u root -p hti < upgrades/0007_round_indexes.sql
+
+ALTER TABLE game_round
+    ADD UNIQUE INDEX game_round_player_id_opponent_id (player_id, opponent_id),
+    ADD INDEX game_round_player_id_is_intentional (player_id, is_intentional);
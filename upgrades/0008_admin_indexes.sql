@@ -0,0 +1,12 @@
+-- Adds the indexes used by the admin's lists of players and rounds: on
+-- Player.registration_datetime and Round.datetime (for browsing by date), and
+-- on Round's (amount_offered, is_intentional, accepted) (for filtering).
+--
+-- Usage: mysql -u root -p hti < upgrades/0008_admin_indexes.sql
+
+ALTER TABLE game_player
+    ADD INDEX game_player_registration_datetime (registration_datetime);
+
+ALTER TABLE game_round
+    ADD INDEX game_round_datetime (datetime),
+    ADD INDEX game_round_amount_offered_is_intentional_accepted (amount_offered, is_intentional, accepted);